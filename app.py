@@ -3,54 +3,1174 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import contextlib
+import contextvars
+import csv
 import datetime
+import functools
+import io
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict, deque
+from decimal import Decimal
 from io import BytesIO
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import PoolError
 
 # =========================
 # CONFIG
 # =========================
 
+# Storage backend: "postgres" (Neon at DB_URL) or "sqlite" (embedded file at SQLITE_PATH)
+DB_BACKEND = os.environ.get("RO_DB_BACKEND", "postgres").lower()
+SQLITE_PATH = os.environ.get("RO_SQLITE_PATH", "ro_uaq.db")
+
 DB_URL = (
     "postgresql://neondb_owner:npg_C4ghxK1yUcfw@"
     "ep-billowing-fog-agxbr2fc-pooler.c-2.eu-central-1.aws.neon.tech/"
     "neondb?sslmode=require&channel_binding=require"
 )
 
+# Connection pool (shared by every Streamlit session in this process)
+POOL_MAX_SIZE = 8          # hard cap on open connections to the Neon pooler
+POOL_TIMEOUT = 10.0        # seconds to wait for a free connection
+POOL_CHECK_IDLE = 30.0     # ping connections that sat idle longer than this
+
+# Read-query cache, per process: writes made through this process invalidate it at once,
+# writes from elsewhere (another app replica, migrate_ro_to_neon.py) show within the TTL.
+# Lower RO_QUERY_CACHE_TTL where several processes write.
+QUERY_CACHE_TTL = float(os.environ.get("RO_QUERY_CACHE_TTL", "300"))  # seconds before a refetch
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+EXPORT_CACHE_MAX_BYTES = 32 * 1024 * 1024  # built report files kept for re-download
+
+# Streaming exports
+EXPORT_CHUNK_ROWS = 5000                # rows per server-side cursor fetch
+EXPORT_SPOOL_BYTES = 16 * 1024 * 1024   # exports larger than this spill to a temp file
+
+# Query instrumentation; RO_DEV_PANEL=1 enables the developer panel, ?dev=1 in the URL shows it
+SLOW_QUERY_MS = float(os.environ.get("RO_SLOW_QUERY_MS", "250"))
+SLOW_QUERY_LOG_SIZE = 200
+N_PLUS_ONE_MIN_REPEATS = 5   # one statement shape this often in a render looks like a loop
+DEV_PANEL = os.environ.get("RO_DEV_PANEL") == "1"
+
+# Page profiler (opt-in): RO_PROFILE=1 enables it, then ?profile=1 in the URL profiles one
+# render and RO_PROFILE_SAMPLE a share of all renders
+PROFILE_PAGES = os.environ.get("RO_PROFILE") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("RO_PROFILE_SAMPLE", "0"))  # share of renders profiled
+PROFILE_INTERVAL_MS = 5.0       # stack sampling period while a render is profiled
+PROFILE_TRACE_MEMORY = os.environ.get("RO_PROFILE_MEMORY", "1") == "1"
+PROFILE_LOG_PATH = os.environ.get("RO_PROFILE_LOG", "ro_profile.jsonl")
+PROFILE_LOG_MAX_BYTES = 16 * 1024 * 1024  # then rotated to <path>.1, replacing the previous one
+PROFILE_REPORT_ROWS = 5000      # latest records read back for the per-release comparison
+RELEASE = os.environ.get("RO_RELEASE")  # label stored with profiles; defaults to the git revision
+
 # CMMS start of operation (1-8-2025)
 CMMS_START_DATE = datetime.date(2025, 8, 1)
 
+# =========================
+# QUERY INSTRUMENTATION
+# =========================
+# Every cursor the app opens, on either backend, reports its statements
+# here: latency, rows and approximate bytes fetched. Statements run while a
+# QueryLog is active (one page render) are collected into it; slow ones
+# also go to a process-wide log.
+
+logger = logging.getLogger("ro_app")
+
+_ACTIVE_QUERY_LOG = contextvars.ContextVar("active_query_log", default=None)
+SLOW_QUERY_LOG = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+_SHAPE_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_SHAPE_VALUES_RE = re.compile(r"\bVALUES\s*(?:\(|%s).*", re.IGNORECASE | re.DOTALL)
+_SHAPE_MAX_CHARS = 500  # batched inserts inline their rows; their prefix is shape enough
+
+# Frames skipped when looking for the code that issued a statement
+_DATA_LAYER_FRAMES = {
+    "wrapper", "work", "with_connection", "run_query", "run_batch", "fetch_df",
+    "iter_query_chunks", "insert_values", "record_statement", "add", "_call_site",
+}
+_LIBRARY_MODULES = ("pandas", "psycopg2", "sqlite3", "streamlit", "functools", "contextlib")
+
+
+@functools.lru_cache(maxsize=1024)
+def _statement_shape(sql, batch):
+    if batch:
+        sql = _SHAPE_VALUES_RE.sub("VALUES (...)", sql)
+    return _SHAPE_LITERAL_RE.sub("?", " ".join(sql.split()))
+
+
+def statement_shape(sql, batch=False):
+    """Statement text with whitespace collapsed and literals / parameters as ``?``.
+
+    Batched inserts keep only the part before their row list.
+    """
+    if isinstance(sql, bytes):
+        sql = sql[:_SHAPE_MAX_CHARS].decode("utf-8", "replace")
+    return _statement_shape(str(sql)[:_SHAPE_MAX_CHARS], batch)
+
+
+def _row_bytes(row):
+    values = row.values() if isinstance(row, dict) else row
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in values)
+
+
+def _call_site():
+    """``function (file:line)`` of the code that issued the current statement."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "")
+        in_data_layer = code.co_filename == __file__ and code.co_name in _DATA_LAYER_FRAMES
+        if not in_data_layer and not module.startswith(_LIBRARY_MODULES):
+            return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        frame = frame.f_back
+    return None
+
+
+class Statement:
+    """One executed statement; fetches add their rows, bytes and time to it."""
+
+    __slots__ = ("shape", "seconds", "rowcount", "fetched", "nbytes", "page", "slow_at")
+
+    def __init__(self, shape, seconds, rowcount, page):
+        self.shape = shape
+        self.seconds = seconds
+        self.rowcount = max(rowcount, 0)
+        self.fetched = 0
+        self.nbytes = 0
+        self.page = page
+        self.slow_at = None
+        self._check_slow()
+
+    @property
+    def rows(self):
+        return max(self.rowcount, self.fetched)
+
+    def add_fetch(self, rows, seconds):
+        if rows:
+            self.fetched += len(rows)
+            self.nbytes += _row_bytes(rows[0]) * len(rows)
+        self.seconds += seconds
+        self._check_slow()
+
+    def _check_slow(self):
+        if self.slow_at is not None or self.seconds * 1000 < SLOW_QUERY_MS:
+            return
+        # Logged once; later fetches keep updating the same entry
+        self.slow_at = datetime.datetime.now()
+        SLOW_QUERY_LOG.append(self)
+        logger.warning("Slow query (%.0f ms) on %s: %s", self.seconds * 1000, self.page, self.shape)
+
+
+class QueryLog:
+    """Statements run while this log is active – used as ``with QueryLog(page):``.
+
+    Statement shapes that repeat at least ``N_PLUS_ONE_MIN_REPEATS`` times
+    are reported by ``repeated()`` with the app function that issued them,
+    the usual sign of a query inside a loop. Batched inserts are recorded
+    but never counted as repeats.
+    """
+
+    def __init__(self, page=None):
+        self.page = page
+        self.statements = []
+        self.cache_hits = 0    # fetch_df reads served without a statement
+        self._repeats = {}     # shape -> count, for non-batch statements
+        self._call_sites = {}  # shape -> caller, captured once the shape looks like a loop
+
+    def __enter__(self):
+        self._token = _ACTIVE_QUERY_LOG.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _ACTIVE_QUERY_LOG.reset(self._token)
+
+    def add(self, stmt, batch=False):
+        self.statements.append(stmt)
+        if batch:
+            return
+        count = self._repeats.get(stmt.shape, 0) + 1
+        self._repeats[stmt.shape] = count
+        if count == N_PLUS_ONE_MIN_REPEATS:
+            self._call_sites[stmt.shape] = _call_site()
+
+    def totals(self):
+        return {
+            "statements": len(self.statements),
+            "ms": round(sum(s.seconds for s in self.statements) * 1000, 2),
+            "rows": sum(s.rows for s in self.statements),
+            "bytes": sum(s.nbytes for s in self.statements),
+            "cache_hits": self.cache_hits,
+        }
+
+    def repeated(self):
+        """[(shape, count, call site)] for statements that look like an N+1 loop."""
+        return [
+            (shape, self._repeats[shape], site) for shape, site in self._call_sites.items()
+        ]
+
+    def by_shape(self):
+        """Per-shape count, latency, rows and bytes, most expensive first."""
+        df = pd.DataFrame(
+            [(s.shape, s.seconds * 1000, s.rows, s.nbytes) for s in self.statements],
+            columns=["statement", "ms", "rows", "bytes"],
+        )
+        if df.empty:
+            return df
+        return (
+            df.groupby("statement", sort=False)
+            .agg(count=("ms", "size"), total_ms=("ms", "sum"), max_ms=("ms", "max"),
+                 rows=("rows", "sum"), bytes=("bytes", "sum"))
+            .round(2)
+            .sort_values("total_ms", ascending=False)
+            .reset_index()
+        )
+
+
+def record_statement(sql, seconds, rowcount, batch=False):
+    """Account one executed statement; returns the Statement fetches report into."""
+    log = _ACTIVE_QUERY_LOG.get()
+    if log is None and seconds * 1000 < SLOW_QUERY_MS:
+        return None
+    stmt = Statement(statement_shape(sql, batch), seconds, rowcount, log.page if log else None)
+    if log is not None:
+        log.add(stmt, batch)
+    return stmt
+
+
+def instrumented_execute(method, batch=False):
+    """Wrap a cursor's execute-like method so the statement is recorded."""
+    @functools.wraps(method)
+    def wrapper(self, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(self, sql, *args, **kwargs)
+        finally:
+            # execute_values hands psycopg2 its pages as bytes
+            self._statement = record_statement(
+                sql, time.perf_counter() - started, self.rowcount,
+                batch=batch or isinstance(sql, bytes),
+            )
+    return wrapper
+
+
+def instrumented_fetch(method):
+    """Wrap a cursor's fetch method so rows, bytes and time go to the last statement."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = method(self, *args, **kwargs)
+        stmt = getattr(self, "_statement", None)
+        if stmt is not None:
+            batch = [rows] if rows is not None and not isinstance(rows, list) else rows
+            stmt.add_fetch(batch, time.perf_counter() - started)
+        return rows
+    return wrapper
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    execute = instrumented_execute(psycopg2.extensions.cursor.execute)
+    executemany = instrumented_execute(psycopg2.extensions.cursor.executemany, batch=True)
+    copy_expert = instrumented_execute(psycopg2.extensions.cursor.copy_expert, batch=True)
+    fetchone = instrumented_fetch(psycopg2.extensions.cursor.fetchone)
+    fetchmany = instrumented_fetch(psycopg2.extensions.cursor.fetchmany)
+    fetchall = instrumented_fetch(psycopg2.extensions.cursor.fetchall)
+
+
+class InstrumentedRealDictCursor(RealDictCursor):
+    execute = instrumented_execute(RealDictCursor.execute)
+    executemany = instrumented_execute(RealDictCursor.executemany, batch=True)
+    copy_expert = instrumented_execute(RealDictCursor.copy_expert, batch=True)
+    fetchone = instrumented_fetch(RealDictCursor.fetchone)
+    fetchmany = instrumented_fetch(RealDictCursor.fetchmany)
+    fetchall = instrumented_fetch(RealDictCursor.fetchall)
+
+
+_INSTRUMENTED_CURSORS = {
+    None: InstrumentedCursor,
+    psycopg2.extensions.cursor: InstrumentedCursor,
+    RealDictCursor: InstrumentedRealDictCursor,
+}
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors record their statements."""
+
+    def cursor(self, *args, cursor_factory=None, **kwargs):
+        factory = _INSTRUMENTED_CURSORS.get(cursor_factory, cursor_factory)
+        return super().cursor(*args, cursor_factory=factory, **kwargs)
+
+
+# =========================
+# PAGE PROFILER
+# =========================
+# Opt-in breakdown of where a page render spends its wall-clock time.
+# Time is split into exclusive phases: "fetch" (data helpers) and "export"
+# (report builders) are entered automatically, pages mark their own
+# "transform" / "render" stretches with profile_mark(). A sampling thread
+# records which app functions and libraries were on the stack, and
+# tracemalloc the peak memory. Each profiled render is appended to
+# PROFILE_LOG_PATH as one JSON line, tagged with the release.
+
+_ACTIVE_PROFILE = contextvars.ContextVar("active_profile", default=None)
+_PROFILE_WRITE_LOCK = threading.Lock()
+_TRACEMALLOC_LOCK = threading.Lock()  # tracemalloc is process-wide: one traced render at a time
+
+
+@functools.lru_cache(maxsize=1)
+def app_release():
+    """RELEASE if set, else the short git revision of this checkout."""
+    if RELEASE:
+        return RELEASE
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+class PageProfile:
+    """Phases, stack samples and peak memory of one page render.
+
+    Used as ``with PageProfile(page):`` around the page call. Phase times
+    are exclusive: while a nested phase runs, the enclosing one is paused,
+    so the phases add up to the render's total.
+    """
+
+    def __init__(self, page, interval_ms=PROFILE_INTERVAL_MS, trace_memory=PROFILE_TRACE_MEMORY):
+        self.page = page
+        self.interval = interval_ms / 1000
+        self.trace_memory = trace_memory
+        self.phases = Counter()
+        self.functions = Counter()  # innermost app function per sample
+        self.libraries = Counter()  # package executing per sample
+        self.samples = 0
+        self.total = None
+        self.peak_bytes = None
+        self._stack = []            # [phase name, segment start]
+        self._stop = threading.Event()
+        self._sampler = None
+        self._traced = False
+
+    def __enter__(self):
+        self._token = _ACTIVE_PROFILE.set(self)
+        if self.trace_memory and _TRACEMALLOC_LOCK.acquire(blocking=False):
+            self._traced = True
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._memory_base = tracemalloc.get_traced_memory()[0]
+        self._sampler = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), daemon=True
+        )
+        self._started = time.perf_counter()
+        self._stack = [["render", self._started]]
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        now = time.perf_counter()
+        self._stop.set()
+        self._sampler.join()
+        while self._stack:
+            name, started = self._stack.pop()
+            self.phases[name] += now - started
+        self.total = now - self._started
+        if self._traced:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1] - self._memory_base
+            if self._started_tracing:
+                tracemalloc.stop()
+            _TRACEMALLOC_LOCK.release()
+        _ACTIVE_PROFILE.reset(self._token)
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            module = frame.f_globals.get("__name__", "")
+            in_app = frame.f_code.co_filename == __file__
+            self.libraries["app" if in_app else module.split(".")[0] or "?"] += 1
+            while frame is not None and frame.f_code.co_filename != __file__:
+                frame = frame.f_back
+            self.functions[frame.f_code.co_name if frame is not None else "?"] += 1
+
+    def enter_phase(self, name):
+        now = time.perf_counter()
+        outer = self._stack[-1]
+        self.phases[outer[0]] += now - outer[1]
+        self._stack.append([name, now])
+
+    def exit_phase(self):
+        now = time.perf_counter()
+        name, started = self._stack.pop()
+        self.phases[name] += now - started
+        self._stack[-1][1] = now
+
+    def mark(self, name):
+        """Attribute the page-level time from here on to phase ``name``."""
+        base = self._stack[0]
+        if len(self._stack) == 1:
+            now = time.perf_counter()
+            self.phases[base[0]] += now - base[1]
+            base[1] = now
+        base[0] = name
+
+    def record(self, log=None):
+        """JSON-ready summary; ``log`` adds the render's database figures."""
+        def shares(counter):
+            return {k: round(v / self.samples, 3) for k, v in counter.most_common(10)}
+
+        rec = {
+            "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "release": app_release(),
+            "backend": DB_BACKEND,
+            "page": self.page,
+            "total_ms": round(self.total * 1000, 2),
+            "phases_ms": {k: round(v * 1000, 2) for k, v in self.phases.most_common()},
+            "peak_kb": round(self.peak_bytes / 1024, 1) if self.peak_bytes is not None else None,
+            "samples": self.samples,
+            "functions": shares(self.functions) if self.samples else {},
+            "libraries": shares(self.libraries) if self.samples else {},
+        }
+        if log is not None:
+            totals = log.totals()
+            rec.update(db_ms=totals["ms"], statements=totals["statements"],
+                       cache_hits=totals["cache_hits"])
+        return rec
+
+
+@contextlib.contextmanager
+def profile_phase(name):
+    """Time the enclosed block (or decorated function) as phase ``name`` when profiling."""
+    profile = _ACTIVE_PROFILE.get()
+    if profile is None:
+        yield
+        return
+    profile.enter_phase(name)
+    try:
+        yield
+    finally:
+        profile.exit_phase()
+
+
+def profile_mark(name):
+    """Start page-level phase ``name`` (e.g. "transform", "render") when profiling."""
+    profile = _ACTIVE_PROFILE.get()
+    if profile is not None:
+        profile.mark(name)
+
+
+def profiling_requested():
+    # Profiling traces memory for the whole process: visitors can't switch it on unless allowed
+    if not PROFILE_PAGES:
+        return False
+    return st.query_params.get("profile") == "1" or random.random() < PROFILE_SAMPLE_RATE
+
+
+def save_profile(rec, path=None):
+    """Append one profile record to the JSONL log, rotating it once it is full."""
+    path = path or PROFILE_LOG_PATH
+    try:
+        with _PROFILE_WRITE_LOCK:
+            if os.path.exists(path) and os.path.getsize(path) >= PROFILE_LOG_MAX_BYTES:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec) + "\n")
+    except OSError as exc:
+        logger.warning("Could not write profile to %s: %s", path, exc)
+
+
+def load_profiles(path=None, limit=PROFILE_REPORT_ROWS):
+    """The latest ``limit`` profile records, rotated log included (empty if none yet)."""
+    path = path or PROFILE_LOG_PATH
+    lines = deque(maxlen=limit)
+    for name in (path + ".1", path):
+        try:
+            with open(name, encoding="utf-8") as f:
+                lines.extend(f)
+        except FileNotFoundError:
+            pass
+    return pd.DataFrame([json.loads(line) for line in lines if line.strip()])
+
+
+def compare_profiles(profiles: pd.DataFrame, page):
+    """Per-release render statistics of one page, latest release first."""
+    df = profiles[profiles["page"] == page]
+    if df.empty:
+        return df
+    phases = pd.json_normalize(df["phases_ms"].tolist()).set_index(df.index).fillna(0.0)
+    df = pd.concat([df[["release", "at", "total_ms", "peak_kb"]], phases.add_suffix("_ms")], axis=1)
+    grouped = df.groupby("release")
+    summary = grouped.median(numeric_only=True).round(1)
+    summary.insert(0, "p95_ms", grouped["total_ms"].quantile(0.95).round(1))
+    summary.insert(0, "renders", grouped.size())
+    summary = summary.rename(columns={"total_ms": "median_ms"})
+    order = grouped["at"].max().sort_values(ascending=False).index
+    return summary.loc[order].reset_index()
+
+
+# =========================
+# SQLITE BACKEND
+# =========================
+# An embedded engine for single-site installs and offline runs. The
+# connection / cursor classes below speak the small part of the psycopg2
+# API the app uses and rewrite Postgres SQL into SQLite's dialect, so the
+# data helpers work unchanged on either backend.
+
+class SqliteUndefinedTable(sqlite3.OperationalError):
+    """"no such table", the SQLite twin of psycopg2.errors.UndefinedTable."""
+
+
+DB_ERRORS = (psycopg2.Error, sqlite3.Error)
+UNDEFINED_TABLE_ERRORS = (psycopg2.errors.UndefinedTable, SqliteUndefinedTable)
+
+_SQLITE_PARAM_RE = re.compile(r"%\((\w+)\)s|%s|%%")
+_SQLITE_REWRITES = [
+    (re.compile(r"\bSERIAL PRIMARY KEY\b", re.IGNORECASE), "INTEGER PRIMARY KEY"),
+    (re.compile(r"\bNOW\(\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\s+INCLUDE\s*\([^)]*\)", re.IGNORECASE), ""),
+    (re.compile(r"\bIS NOT DISTINCT FROM\b", re.IGNORECASE), "IS"),
+]
+_SQLITE_LOCK_RE = re.compile(r"^\s*(?:LOCK TABLE|SELECT pg_advisory_xact_lock)\b", re.IGNORECASE)
+_SQLITE_STAGE_RE = re.compile(
+    r"^\s*CREATE TEMP TABLE (\w+) ON COMMIT DROP AS (.*) WITH NO DATA\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_SQLITE_ADD_COLUMN_RE = re.compile(
+    r"^\s*ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+)(.*?);?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_SQLITE_COPY_RE = re.compile(
+    r"^\s*COPY (\w+) \(([^)]*)\) FROM STDIN WITH \(FORMAT csv(?:, NULL '([^']*)')?\)\s*$",
+    re.IGNORECASE,
+)
+
+
+def _sqlite_param(match):
+    if match.group(1):
+        return ":" + match.group(1)
+    return "?" if match.group(0) == "%s" else "%"
+
+
+@functools.lru_cache(maxsize=1024)
+def sqlite_sql(sql):
+    """Postgres-flavoured app SQL rewritten for SQLite (placeholders, DDL types)."""
+    sql = _SQLITE_PARAM_RE.sub(_sqlite_param, sql)
+    for pattern, replacement in _SQLITE_REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def _lenient(parse):
+    """SQLite converter running ``parse`` on the text; a value it rejects comes back as text.
+
+    SQLite doesn't check column types, so one hand-edited or imported value
+    must not break every later read of the column.
+    """
+    def convert(value):
+        text = value.decode()
+        try:
+            return parse(text)
+        except ValueError:
+            return text
+    return convert
+
+
+def _sqlite_time(text):
+    try:
+        return datetime.time.fromisoformat(text)
+    except ValueError:
+        # Unpadded "8:00" / "8:00:00", as older imports stored them
+        return datetime.datetime.strptime(text, "%H:%M:%S" if text.count(":") == 2 else "%H:%M").time()
+
+
+def _register_sqlite_types():
+    """Store dates, times and decimals as Postgres would hand them back."""
+    sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+    sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(" "))
+    sqlite3.register_adapter(datetime.time, lambda t: t.isoformat())
+    sqlite3.register_adapter(Decimal, float)
+    sqlite3.register_adapter(np.int64, int)
+    sqlite3.register_adapter(np.bool_, bool)
+    sqlite3.register_converter("DATE", _lenient(lambda v: datetime.date.fromisoformat(v[:10])))
+    sqlite3.register_converter("TIMESTAMP", _lenient(datetime.datetime.fromisoformat))
+    sqlite3.register_converter("TIME", _lenient(_sqlite_time))
+    sqlite3.register_converter("BOOLEAN", lambda v: v not in (b"0", b""))
+
+
+_register_sqlite_types()
+
+
+class SqliteCursor:
+    """psycopg2-style cursor over sqlite3: context manager, %s params, dict rows."""
+
+    def __init__(self, conn, dict_rows=False):
+        self._conn = conn
+        self._cur = conn.raw.cursor()
+        if dict_rows:
+            self._cur.row_factory = lambda cur, row: dict(
+                zip([d[0] for d in cur.description], row)
+            )
+        self.itersize = EXPORT_CHUNK_ROWS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+    def _begin_immediate(self):
+        # Table / advisory locks become SQLite's single writer lock
+        if not self._conn.raw.in_transaction:
+            self._cur.execute("BEGIN IMMEDIATE")
+
+    @instrumented_execute
+    def execute(self, sql, params=None):
+        if _SQLITE_LOCK_RE.match(sql):
+            self._begin_immediate()
+            return
+        stage = _SQLITE_STAGE_RE.match(sql)
+        if stage:
+            name, select = stage.groups()
+            self._cur.execute(f"DROP TABLE IF EXISTS temp.{name}")
+            self._cur.execute(f"CREATE TEMP TABLE {name} AS {sqlite_sql(select)} LIMIT 0")
+            return
+        add_column = _SQLITE_ADD_COLUMN_RE.match(sql)
+        if add_column:
+            table, column, definition = add_column.groups()
+            existing = {row[1] for row in self._cur.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self._cur.execute(f"ALTER TABLE {table} ADD COLUMN {column}{definition}")
+            return
+        try:
+            self._cur.execute(sqlite_sql(sql), params if params is not None else ())
+        except sqlite3.OperationalError as exc:
+            if str(exc).startswith("no such table"):
+                raise SqliteUndefinedTable(str(exc)) from exc
+            raise
+
+    @functools.partial(instrumented_execute, batch=True)
+    def execute_values(self, sql, rows):
+        """Stand-in for psycopg2.extras.execute_values: ``VALUES %s`` for every row."""
+        if not rows:
+            return
+        placeholders = "(" + ", ".join("?" * len(rows[0])) + ")"
+        self._cur.executemany(sqlite_sql(sql.replace("VALUES %s", "VALUES " + placeholders)), rows)
+
+    @functools.partial(instrumented_execute, batch=True)
+    def copy_expert(self, sql, buf):
+        """Stand-in for COPY ... FROM STDIN WITH (FORMAT csv): a batched insert."""
+        table, columns, null = _SQLITE_COPY_RE.match(sql).groups()
+        data = buf.read()
+        if isinstance(data, bytes):
+            data = data.decode()
+        null = "" if null is None else null
+        rows = [
+            [None if v == null else v for v in row]
+            for row in csv.reader(io.StringIO(data))
+        ]
+        if rows:
+            placeholders = ", ".join("?" * len(rows[0]))
+            self._cur.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+
+    @instrumented_fetch
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    @instrumented_fetch
+    def fetchmany(self, size=None):
+        return self._cur.fetchmany(size or self.itersize)
+
+    @instrumented_fetch
+    def fetchall(self):
+        return self._cur.fetchall()
+
+
+class SqliteConnection:
+    """sqlite3 connection in WAL mode with the psycopg2 surface the pool and helpers use."""
+
+    def __init__(self, path):
+        self.raw = sqlite3.connect(
+            path,
+            timeout=30,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,  # borrowed by one pool user at a time
+        )
+        self.raw.execute("PRAGMA journal_mode=WAL")
+        self.raw.execute("PRAGMA synchronous=NORMAL")
+        self.raw.execute("PRAGMA foreign_keys=ON")
+        self.closed = 0
+
+    def cursor(self, name=None, cursor_factory=None):
+        # A named (server-side) cursor needs nothing special: SQLite cursors stream
+        return SqliteCursor(self, dict_rows=cursor_factory is RealDictCursor)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_INTRANS if self.raw.in_transaction else TRANSACTION_STATUS_IDLE
+
+
+def insert_values(cur, sql, rows, page_size=5000):
+    """execute_values on either backend."""
+    if isinstance(cur, SqliteCursor):
+        cur.execute_values(sql, rows)
+    else:
+        execute_values(cur, sql, rows, page_size=page_size)
+
+
 # =========================
 # DB HELPERS
 # =========================
 
 def get_conn():
-    return psycopg2.connect(DB_URL)
+    if DB_BACKEND == "sqlite":
+        return SqliteConnection(SQLITE_PATH)
+    return psycopg2.connect(
+        DB_URL,
+        connection_factory=InstrumentedConnection,
+        connect_timeout=10,
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3,
+    )
 
 
-def run_query(sql, params=None, fetch=False):
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute(sql, params or [])
-    data = cur.fetchall() if fetch else None
-    conn.commit()
-    cur.close()
-    conn.close()
+class ConnectionPool:
+    """Bounded, thread-safe pool of warm database connections.
+
+    Checkout blocks (up to ``timeout`` seconds) when ``max_size`` connections
+    are already borrowed. Connections that sat idle longer than
+    ``check_idle`` seconds are pinged before being handed out, and broken
+    ones are replaced by a fresh connection.
+    """
+
+    def __init__(self, connect, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 check_idle=POOL_CHECK_IDLE):
+        self._connect = connect
+        self._max_size = max_size
+        self._timeout = timeout
+        self._check_idle = check_idle
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = deque()  # (conn, last_used) – most recently used on the right
+        self._in_use = 0
+        self._opened = 0
+        self._checkouts = 0
+        self._dropped = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self._check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except DB_ERRORS:
+            return False
+
+    def _take_connection(self):
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                conn = self._connect()
+                with self._lock:
+                    self._opened += 1
+                return conn
+            conn, last_used = item
+            if self._is_healthy(conn, last_used):
+                return conn
+            self._close_quietly(conn)
+            with self._lock:
+                self._dropped += 1
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except DB_ERRORS:
+            pass
+
+    def getconn(self):
+        """Borrow a healthy connection, opening a new one if none is idle."""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self._timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolError(f"No database connection free after {self._timeout:.0f}s")
+        waited = time.monotonic() - started
+        try:
+            conn = self._take_connection()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a borrowed connection; broken or discarded ones are closed."""
+        try:
+            if conn.closed:
+                with self._lock:
+                    self._dropped += 1
+            elif not discard:
+                try:
+                    if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except DB_ERRORS:
+                    discard = True
+            if discard or conn.closed:
+                self._close_quietly(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def metrics(self):
+        """Snapshot of pool usage for sizing under load."""
+        with self._lock:
+            return {
+                "max_size": self._max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "opened": self._opened,
+                "checkouts": self._checkouts,
+                "dropped": self._dropped,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(1000 * self._wait_total / self._checkouts, 2)
+                if self._checkouts else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 2),
+            }
+
+
+@st.cache_resource
+def get_pool():
+    """Process-wide connection pool shared by all sessions."""
+    return ConnectionPool(get_conn)
+
+
+@profile_phase("fetch")
+def with_connection(work):
+    """Run ``work(conn)`` on a pooled connection.
+
+    If the borrowed connection turns out to be dead (e.g. closed by the Neon
+    pooler while idle), it is dropped and the call is retried once on a
+    fresh connection.
+    """
+    pool = get_pool()
+    for attempt in range(2):
+        conn = pool.getconn()
+        try:
+            result = work(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            dropped = bool(conn.closed)
+            pool.putconn(conn, discard=True)
+            if dropped and attempt == 0:
+                continue
+            raise
+        except BaseException:
+            pool.putconn(conn)
+            raise
+        pool.putconn(conn)
+        return result
+
+
+_READ_TABLES_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+_WRITE_TABLES_RE = re.compile(
+    r"\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?|ALTER\s+TABLE)"
+    r"\s+([A-Za-z_][A-Za-z0-9_]*)",
+    re.IGNORECASE,
+)
+
+
+def read_tables(sql):
+    """Lower-cased names of the tables a SELECT reads from."""
+    return frozenset(t.lower() for t in _READ_TABLES_RE.findall(sql))
+
+
+def written_tables(sql):
+    """Lower-cased names of the tables a statement writes to."""
+    # "ON CONFLICT ... DO UPDATE SET" is not a table write of its own
+    return frozenset(t.lower() for t in _WRITE_TABLES_RE.findall(sql)) - {"set"}
+
+
+class QueryCache:
+    """LRU cache of query results, invalidated by per-table version counters.
+
+    Each entry remembers the versions of the tables it read at fetch time;
+    any write to one of those tables bumps its version and the entry is
+    treated as stale. Entries also expire after ``ttl`` seconds, which bounds
+    staleness from writes made by other processes.
+    """
+
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES,
+                 max_bytes=QUERY_CACHE_MAX_BYTES):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, versions, nbytes, df)
+        self._versions = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(sql, params):
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        elif params is not None:
+            params = tuple(params)
+        return sql, params
+
+    def versions(self, tables):
+        with self._lock:
+            return tuple((t, self._versions.get(t, 0)) for t in sorted(tables))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, versions, _, df = entry
+                if expires_at > time.monotonic() and all(
+                    self._versions.get(t, 0) == v for t, v in versions
+                ):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return df
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, versions, df):
+        nbytes = len(df) if isinstance(df, bytes) else int(df.memory_usage(deep=True).sum())
+        if nbytes > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self._ttl, versions, nbytes, df)
+            self._bytes += nbytes
+            while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def invalidate(self, tables):
+        with self._lock:
+            for t in tables:
+                self._versions[t] = self._versions.get(t, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+@st.cache_resource
+def get_query_cache():
+    """Process-wide read cache shared by all sessions."""
+    return QueryCache()
+
+
+@st.cache_resource
+def get_export_cache():
+    """Built export files, bounded by their total size; keys carry the data versions."""
+    return QueryCache(max_bytes=EXPORT_CACHE_MAX_BYTES)
+
+
+def cached_export(build, *args):
+    """File bytes of ``build(*args)``, built once and kept while they fit the export cache."""
+    cache = get_export_cache()
+    key = (build.__qualname__, args)
+    data = cache.get(key)
+    if data is None:
+        with st.spinner("Building report…"):
+            data = build(*args)
+        cache.put(key, (), data)
     return data
 
 
-def fetch_df(sql, params=None):
-    conn = get_conn()
-    df = pd.read_sql(sql, conn, params=params)
-    conn.close()
+def invalidate_tables(*tables):
+    """Mark cached reads of these tables stale after a write."""
+    get_query_cache().invalidate(t.lower() for t in tables)
+    memo = _RERUN_MEMO.get()
+    if memo and tables:
+        memo.clear()
+
+
+def run_query(sql, params=None, fetch=False):
+    def work(conn):
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(sql, params or [])
+            data = cur.fetchall() if fetch else None
+        conn.commit()
+        return data
+
+    try:
+        return with_connection(work)
+    finally:
+        invalidate_tables(*written_tables(sql))
+
+
+def run_batch(sql, rows, page_size=5000):
+    """Run a multi-row ``INSERT ... VALUES %s`` for ``rows`` in one transaction.
+
+    Returns the number of rows actually written; rows skipped by
+    ``ON CONFLICT DO NOTHING`` are not counted.
+    """
+    if not rows:
+        return 0
+
+    def work(conn):
+        written = 0
+        with conn.cursor() as cur:
+            for i in range(0, len(rows), page_size):
+                insert_values(cur, sql, rows[i:i + page_size], page_size=page_size)
+                written += cur.rowcount
+        conn.commit()
+        return written
+
+    try:
+        return with_connection(work)
+    finally:
+        invalidate_tables(*written_tables(sql))
+
+
+def iter_query_chunks(sql, params=None, chunk_size=EXPORT_CHUNK_ROWS):
+    """Yield (column names, rows) chunks of a query from a server-side cursor.
+
+    Only ``chunk_size`` rows are held in memory at a time, however large
+    the result. At least one (possibly empty) chunk is always yielded so
+    callers get the column names.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+            cur.itersize = chunk_size
+            cur.execute(sql, params)
+            first = True
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows and not first:
+                    break
+                first = False
+                yield [d[0] for d in cur.description], rows
+                if len(rows) < chunk_size:
+                    break
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
+
+
+@profile_phase("fetch")
+def fetch_df(sql, params=None, cache=True):
+    """Run a SELECT into a DataFrame, served from the read cache when fresh.
+
+    Callers always get their own copy, so they are free to modify it.
+    """
+    query_cache = get_query_cache()
+    key = QueryCache.make_key(sql, params)
+    if cache:
+        df = query_cache.get(key)
+        if df is not None:
+            log = _ACTIVE_QUERY_LOG.get()
+            if log is not None:
+                log.cache_hits += 1
+            return df.copy()
+        # Snapshot versions before reading so a concurrent write is never masked
+        versions = query_cache.versions(read_tables(sql))
+
+    def work(conn):
+        df = pd.read_sql(sql, conn, params=params)
+        conn.rollback()
+        return df
+
+    df = with_connection(work)
+    if cache:
+        query_cache.put(key, versions, df)
+        return df.copy()
     return df
 
 
-def init_db():
-    """Create/upgrade all database tables."""
-    ddl_statements = [
+# Ordered schema migrations: (version, description, statements).
+# Append new entries at the end; never edit or renumber applied ones.
+SCHEMA_MIGRATIONS = [
+    (1, "Base tables", [
         # Flowmeter
         """
         CREATE TABLE IF NOT EXISTS flowmeter_readings (
@@ -197,72 +1317,359 @@ def init_db():
             due_date DATE NOT NULL,
             status VARCHAR(20) DEFAULT 'Pending'
         );
+        """,
+    ]),
+    (2, "Chemical cost / value columns", [
+        "ALTER TABLE chemicals_stock ADD COLUMN IF NOT EXISTS unit_cost NUMERIC(12,2);",
+        "ALTER TABLE chemicals_stock ADD COLUMN IF NOT EXISTS stock_value NUMERIC(12,2);",
+        "ALTER TABLE chemicals_movement ADD COLUMN IF NOT EXISTS unit_cost NUMERIC(12,2);",
+        "ALTER TABLE chemicals_movement ADD COLUMN IF NOT EXISTS stock_value NUMERIC(12,2);",
+    ]),
+    (3, "One work order per task and due date", [
+        # Keep completed / cancelled rows over pending duplicates, then the oldest
         """
-    ]
+        DELETE FROM maintenance_workorders
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY master_id, due_date
+                    ORDER BY (status = 'Pending'), id
+                ) AS rn
+                FROM maintenance_workorders
+            ) ranked
+            WHERE rn > 1
+        );
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS maintenance_workorders_master_due_key
+        ON maintenance_workorders (master_id, due_date);
+        """,
+    ]),
+    (4, "One to-do item per task and due date", [
+        """
+        DELETE FROM operator_todo_items
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY master_id, due_date
+                    ORDER BY (status = 'Pending'), id
+                ) AS rn
+                FROM operator_todo_items
+            ) ranked
+            WHERE rn > 1
+        );
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS operator_todo_items_master_due_key
+        ON operator_todo_items (master_id, due_date);
+        """,
+    ]),
+    (5, "Indexes for page query patterns", [
+        # Permeate trend / latest sample: filter by point, ordered by time
+        """
+        CREATE INDEX IF NOT EXISTS water_quality_point_ts_idx
+        ON water_quality (point, sample_date, sample_time, id) INCLUDE (tds, ph);
+        """,
+        # Water quality history window
+        """
+        CREATE INDEX IF NOT EXISTS water_quality_sample_ts_idx
+        ON water_quality (sample_date, sample_time, id);
+        """,
+        # CMMS overdue / upcoming / dashboard counts
+        """
+        CREATE INDEX IF NOT EXISTS maintenance_workorders_status_due_idx
+        ON maintenance_workorders (status, due_date);
+        """,
+        # CMMS recently completed
+        """
+        CREATE INDEX IF NOT EXISTS maintenance_workorders_status_completion_idx
+        ON maintenance_workorders (status, completion_date);
+        """,
+        # Last balance per chemical
+        """
+        CREATE INDEX IF NOT EXISTS chemicals_movement_chemical_date_idx
+        ON chemicals_movement (chemical, movement_date DESC, id DESC);
+        """,
+        # Movements history window
+        """
+        CREATE INDEX IF NOT EXISTS chemicals_movement_date_idx
+        ON chemicals_movement (movement_date, id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS cartridge_filters_entry_date_idx
+        ON cartridge_filters (entry_date, id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS maintenance_log_maint_date_idx
+        ON maintenance_log (maint_date, id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS system_status_status_time_idx
+        ON system_status (status_time);
+        """,
+        # To-do items are already covered by the (master_id, due_date) unique key
+        """
+        CREATE INDEX IF NOT EXISTS operator_todo_master_operator_idx
+        ON operator_todo_master (operator_name);
+        """,
+    ]),
+    (6, "Keyset pagination indexes for history tables", [
+        """
+        CREATE INDEX IF NOT EXISTS water_quality_sample_date_id_idx
+        ON water_quality (sample_date, id);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS system_status_status_time_id_idx
+        ON system_status (status_time, id);
+        """,
+        "DROP INDEX IF EXISTS system_status_status_time_idx;",
+        # History pages order by (sample_date, id) and the permeate lookups use
+        # water_quality_point_ts_idx, so this one only costs inserts
+        "DROP INDEX IF EXISTS water_quality_sample_ts_idx;",
+    ]),
+]
+
+SCHEMA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT,
+    applied_at TIMESTAMP DEFAULT NOW()
+);
+"""
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent processes migrate one at a time
+SCHEMA_LOCK_ID = 7310401
+
+
+def init_db():
+    """Apply pending schema migrations; return the versions applied."""
+    latest = SCHEMA_MIGRATIONS[-1][0]
+
+    def work(conn):
+        with conn.cursor() as cur:
+            try:
+                cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                if cur.fetchone()[0] >= latest:
+                    conn.rollback()
+                    return []
+            except UNDEFINED_TABLE_ERRORS:
+                conn.rollback()
+
+            # Lock before any DDL, so two first starts don't race to create schema_version
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+            cur.execute(SCHEMA_VERSION_DDL)
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            current = cur.fetchone()[0]
+
+            applied = []
+            for version, description, statements in SCHEMA_MIGRATIONS:
+                if version <= current:
+                    continue
+                for stmt in statements:
+                    cur.execute(stmt)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s,%s)",
+                    (version, description),
+                )
+                applied.append(version)
+        conn.commit()
+        return applied
 
-    conn = get_conn()
-    cur = conn.cursor()
-    for ddl in ddl_statements:
-        cur.execute(ddl)
+    applied = with_connection(work)
+    if applied:
+        get_query_cache().clear()
+    return applied
 
-    # Extra columns for chemical cost / value
-    cur.execute("ALTER TABLE chemicals_stock ADD COLUMN IF NOT EXISTS unit_cost NUMERIC(12,2);")
-    cur.execute("ALTER TABLE chemicals_stock ADD COLUMN IF NOT EXISTS stock_value NUMERIC(12,2);")
-    cur.execute("ALTER TABLE chemicals_movement ADD COLUMN IF NOT EXISTS unit_cost NUMERIC(12,2);")
-    cur.execute("ALTER TABLE chemicals_movement ADD COLUMN IF NOT EXISTS stock_value NUMERIC(12,2);")
 
-    conn.commit()
-    cur.close()
-    conn.close()
+@st.cache_resource(show_spinner=False)
+def ensure_schema():
+    """Migrate and seed the database once per process, not on every rerun."""
+    applied = init_db()
+    seed_maintenance_master()
+    return applied
 
 
 # =========================
 # EXPORT HELPERS
 # =========================
 
-try:
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.pdfgen import canvas
-    REPORTLAB_AVAILABLE = True
-except Exception:
-    REPORTLAB_AVAILABLE = False
-
+PDF_FONT_SIZE = 8
+PDF_ROW_HEIGHT = 10
+PDF_MARGIN = 36
+PDF_CHART_POINTS = 300
+
+
+@profile_phase("export")
+def export_query_to_excel(sheets, chunk_size=EXPORT_CHUNK_ROWS):
+    """Stream query results into an Excel workbook with bounded memory.
+
+    ``sheets`` is a list of (sheet name, sql, params). Rows are pulled from
+    a server-side cursor chunk by chunk and appended to a write-only
+    openpyxl workbook, which keeps rows on disk rather than in memory. The
+    workbook goes to a spooled temp file, returned positioned at the start.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for sheet_name, sql, params in sheets:
+        ws = wb.create_sheet(title=sheet_name[:31])
+        header_written = False
+        for columns, rows in iter_query_chunks(sql, params, chunk_size):
+            if not header_written:
+                ws.append(columns)
+                header_written = True
+            for row in rows:
+                ws.append(row)
+
+    out = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    wb.save(out)
+    out.seek(0)
+    return out
+
+
+def format_table_text(df: pd.DataFrame):
+    """Format every column to display strings with column-wise operations.
+
+    Returns (DataFrame of strings, names of the numeric columns).
+    """
+    out = pd.DataFrame(index=df.index)
+    numeric_cols = set()
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            text = np.where(series.to_numpy(), "Yes", "No")
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            text = series.dt.strftime("%Y-%m-%d").fillna("")
+        else:
+            numeric = pd.to_numeric(series, errors="coerce")
+            if series.notna().any() and numeric[series.notna()].notna().all():
+                values = numeric.to_numpy(dtype=float)
+                fmt = "%d" if pd.api.types.is_integer_dtype(series) else "%.2f"
+                text = np.where(np.isnan(values), "", np.char.mod(fmt, values))
+                numeric_cols.add(col)
+            else:
+                text = series.astype(str).where(series.notna(), "")
+        out[col] = pd.Series(text, index=df.index, dtype=object)
+    return out, numeric_cols
+
+
+@profile_phase("export")
+def export_table_pdf(title: str, df: pd.DataFrame, subtitle: str = "",
+                     summary=None, chart=None) -> BytesIO:
+    """Render a DataFrame as a paginated, column-aligned PDF report (landscape A4).
+
+    ``summary`` is a list of (label, text) pairs and ``chart`` an optional
+    (caption, Series) line chart, both shown on the first page. Cells are
+    formatted and padded column-wise and each page body is drawn as one
+    text block, so large tables render in seconds. Raises RuntimeError when
+    reportlab is not installed.
+    """
+    # Imported on first use: reportlab adds ~0.2 s to startup and most runs never export
+    try:
+        from reportlab.graphics import renderPDF
+        from reportlab.graphics.charts.lineplots import LinePlot
+        from reportlab.graphics.shapes import Drawing
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        from reportlab.pdfgen import canvas
+    except ImportError as exc:
+        raise RuntimeError("PDF export needs the 'reportlab' package (pip install reportlab).") from exc
 
-def export_df_to_excel(df: pd.DataFrame, sheet_name: str = "Sheet1") -> BytesIO:
-    """Return an in-memory Excel file from a DataFrame."""
     buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-    buffer.seek(0)
-    return buffer
-
+    width, height = landscape(A4)
+    c = canvas.Canvas(buffer, pagesize=(width, height))
+
+    # Fixed-width body font: padding the strings is enough to align columns
+    char_w = stringWidth("0", "Courier", PDF_FONT_SIZE)
+    max_chars = int((width - 2 * PDF_MARGIN) / char_w)
+    text, numeric_cols = format_table_text(df)
+    numeric = [col in numeric_cols for col in df.columns]
+    widths = [
+        max(len(str(col)), int(text[col].str.len().max() if len(text) else 0))
+        for col in df.columns
+    ]
+    # Shrink the widest columns until the row fits the page
+    while sum(widths) + 2 * (len(widths) - 1) > max_chars and max(widths) > 6:
+        widths[widths.index(max(widths))] -= 1
 
-def export_simple_pdf(title: str, lines: list) -> BytesIO:
-    """Create a basic PDF (landscape A4) with title and text lines."""
-    buffer = BytesIO()
-    if not REPORTLAB_AVAILABLE:
-        buffer.write(b"")
-        buffer.seek(0)
-        return buffer
+    header = "  ".join(
+        str(col)[:w].rjust(w) if num else str(col)[:w].ljust(w)
+        for col, w, num in zip(df.columns, widths, numeric)
+    )
+    body = None
+    for col, w, num in zip(df.columns, widths, numeric):
+        cells = text[col].str.slice(0, w)
+        cells = cells.str.rjust(w) if num else cells.str.ljust(w)
+        body = cells if body is None else body + "  " + cells
+    lines = body.tolist() if body is not None else []
+
+    top = height - PDF_MARGIN
+    rows_per_page = int((top - PDF_MARGIN - 3 * PDF_ROW_HEIGHT) / PDF_ROW_HEIGHT)
+    table_pages = max(1, -(-len(lines) // rows_per_page))
+    has_cover = bool(summary) or chart is not None
+    total_pages = table_pages + (1 if has_cover else 0)
+
+    def page_frame(page_no):
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(PDF_MARGIN, top, title)
+        c.setFont("Helvetica", 9)
+        if subtitle:
+            c.drawString(PDF_MARGIN, top - 14, subtitle)
+        c.drawRightString(width - PDF_MARGIN, PDF_MARGIN - 14, f"Page {page_no} of {total_pages}")
+
+    page_no = 1
+    if has_cover:
+        page_frame(page_no)
+        y = top - 44
+        c.setFont("Helvetica", 11)
+        for label, value in summary or []:
+            c.drawString(PDF_MARGIN, y, f"{label}:")
+            c.drawString(PDF_MARGIN + 160, y, str(value))
+            y -= 16
+        if chart is not None:
+            caption, series = chart
+            values = pd.to_numeric(series, errors="coerce").fillna(0.0).to_numpy(dtype=float)
+            if len(values) > PDF_CHART_POINTS:
+                # Mean per bucket keeps the shape with a bounded number of points
+                values = np.array([b.mean() for b in np.array_split(values, PDF_CHART_POINTS)])
+            if len(values):
+                y -= 10
+                c.setFont("Helvetica-Bold", 10)
+                c.drawString(PDF_MARGIN, y, caption)
+                chart_h = min(260, y - PDF_MARGIN - 20)
+                drawing = Drawing(width - 2 * PDF_MARGIN, chart_h)
+                plot = LinePlot()
+                plot.x, plot.y = 40, 20
+                plot.width, plot.height = width - 2 * PDF_MARGIN - 60, chart_h - 30
+                plot.data = [list(zip(range(len(values)), values.tolist()))]
+                plot.lines[0].strokeColor = colors.HexColor("#047857")
+                plot.xValueAxis.visibleLabels = False
+                plot.yValueAxis.valueMin = 0
+                drawing.add(plot)
+                renderPDF.draw(drawing, c, PDF_MARGIN, y - chart_h - 6)
+                if len(series.index):
+                    c.setFont("Helvetica", 8)
+                    c.drawString(PDF_MARGIN + 40, y - chart_h - 10, str(series.index[0])[:10])
+                    c.drawRightString(width - PDF_MARGIN - 20, y - chart_h - 10,
+                                      str(series.index[-1])[:10])
+        c.showPage()
+        page_no += 1
+
+    for start in range(0, max(len(lines), 1), rows_per_page):
+        page_frame(page_no)
+        y = top - 36
+        c.setFont("Courier-Bold", PDF_FONT_SIZE)
+        c.drawString(PDF_MARGIN, y, header)
+        c.setStrokeColor(colors.HexColor("#047857"))
+        c.line(PDF_MARGIN, y - 3, width - PDF_MARGIN, y - 3)
+        block = c.beginText(PDF_MARGIN, y - PDF_ROW_HEIGHT - 2)
+        block.setFont("Courier", PDF_FONT_SIZE, leading=PDF_ROW_HEIGHT)
+        block.textLines("\n".join(lines[start:start + rows_per_page]), trim=0)
+        c.drawText(block)
+        c.showPage()
+        page_no += 1
 
-    c = canvas.Canvas(buffer, pagesize=landscape(A4))
-    width, height = landscape(A4)
-    y = height - 40
-
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(40, y, title)
-    y -= 40
-
-    c.setFont("Helvetica", 10)
-    for line in lines:
-        if y < 40:
-            c.showPage()
-            y = height - 40
-            c.setFont("Helvetica", 10)
-        c.drawString(40, y, str(line))
-        y -= 14
-
-    c.showPage()
     c.save()
     buffer.seek(0)
     return buffer
@@ -391,6 +1798,229 @@ button[data-baseweb="tab"] {
 
 def apply_theme():
     st.markdown(THEME_CSS, unsafe_allow_html=True)
+
+
+# =========================
+# PAGINATED HISTORY TABLES
+# =========================
+
+HISTORY_PAGE_SIZES = [25, 50, 100, 250]
+
+# Column projection per view: (table, columns rendered, long-text column fetched on demand).
+# Views only request what they display; free text is loaded when a row is selected.
+TABLE_VIEWS = {
+    "flowmeter_history": (
+        "flowmeter_readings",
+        ["id", "reading_date", "reading_value", "operator"],
+        "notes",
+    ),
+    "filters_history": (
+        "cartridge_filters",
+        ["id", "entry_date", "pressure_before", "pressure_after", "diff_pressure",
+         "status", "operator"],
+        "notes",
+    ),
+    "chem_history": (
+        "chemicals_movement",
+        ["id", "movement_date", "chemical", "qty_in", "qty_out", "balance",
+         "unit_cost", "stock_value", "operator"],
+        "notes",
+    ),
+    "maint_history": (
+        "maintenance_log",
+        ["id", "maint_date", "component", "action", "operator"],
+        "notes",
+    ),
+    "status_history": (
+        "system_status",
+        ["id", "status_time", "hp_pump", "lp_pump", "feed_pump", "ro_running"],
+        None,
+    ),
+    "wq_history": (
+        "water_quality",
+        ["id", "sample_date", "sample_time", "point", "tds", "ph", "conductivity",
+         "turbidity", "operator"],
+        "notes",
+    ),
+    "production_report": (
+        "daily_production",
+        ["prod_date", "prod_value", "cumulative_month", "cumulative_total"],
+        None,
+    ),
+}
+
+
+def view_select(view):
+    """SELECT list for a view: its columns plus a has_<text> flag for lazy text."""
+    _, columns, lazy_text = TABLE_VIEWS[view]
+    select = list(columns)
+    if lazy_text:
+        select.append(f"{lazy_text} IS NOT NULL AS has_{lazy_text}")
+    return ", ".join(select)
+
+
+def show_lazy_text(view, df, selected_rows):
+    """Fetch and show the long-text column of the selected row only."""
+    table, _, lazy_text = TABLE_VIEWS[view]
+    if not lazy_text:
+        return
+    if not selected_rows:
+        st.caption(f"Select a row to show its {lazy_text}.")
+        return
+    row = df.iloc[selected_rows[0]]
+    if not row[f"has_{lazy_text}"]:
+        st.caption(f"No {lazy_text} for record {row['id']}.")
+        return
+    text = fetch_df(f"SELECT {lazy_text} FROM {table} WHERE id=%s", (int(row["id"]),))
+    if not text.empty:
+        st.text_area(f"{lazy_text.capitalize()} – record {row['id']}",
+                     text[lazy_text].iloc[0], disabled=True, key=f"{view}_{lazy_text}")
+
+
+def _page_next(key):
+    state = st.session_state[key]
+    if state["next_cursor"] is not None:
+        state["cursors"].append(state["next_cursor"])
+
+
+def _page_prev(key):
+    state = st.session_state[key]
+    if len(state["cursors"]) > 1:
+        state["cursors"].pop()
+
+
+def history_page_sql(view, date_col, where=None, after_cursor=False, page_size=HISTORY_PAGE_SIZES[0]):
+    """One page of a history view, newest first.
+
+    Placeholders: those of ``where``, then the (date, id) cursor when
+    ``after_cursor`` is set. One extra row is fetched to tell if a next page exists.
+    """
+    conditions = [where] if where else []
+    if after_cursor:
+        conditions.append(f"({date_col}, id) < (%s, %s)")
+    cond_sql = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return (
+        f"SELECT {view_select(view)} FROM {TABLE_VIEWS[view][0]}{cond_sql} "
+        f"ORDER BY {date_col} DESC, id DESC LIMIT {page_size + 1}"
+    )
+
+
+def paginated_table(key, date_col, where=None, params=(),
+                    empty_msg="No records for selected period."):
+    """Show the ``key`` view of TABLE_VIEWS newest first, one page at a time.
+
+    Uses keyset pagination on (date_col, id): each page continues strictly
+    after the last (date, id) of the previous one, so only one page is ever
+    transferred. ``where`` is an optional SQL condition with %s placeholders
+    bound from ``params``. Returns the DataFrame of the page shown.
+    """
+    table, _, lazy_text = TABLE_VIEWS[key]
+    page_size = st.selectbox("Rows per page", HISTORY_PAGE_SIZES, key=f"{key}_size")
+    signature = (table, where, tuple(params), page_size)
+    state = st.session_state.get(key)
+    if state is None or state["signature"] != signature:
+        state = {"signature": signature, "cursors": [None], "next_cursor": None}
+        st.session_state[key] = state
+
+    where_sql = f" WHERE {where}" if where else ""
+    total = int(fetch_df(f"SELECT COUNT(*) AS c FROM {table}{where_sql}", params)["c"].iloc[0])
+
+    cursor = state["cursors"][-1]
+    df = fetch_df(
+        history_page_sql(key, date_col, where, cursor is not None, page_size),
+        list(params) + list(cursor or ()),
+    )
+
+    has_next = len(df) > page_size
+    df = df.head(page_size)
+    if has_next:
+        last_date = df[date_col].iloc[-1]
+        if isinstance(last_date, pd.Timestamp):
+            last_date = last_date.to_pydatetime()
+        state["next_cursor"] = (last_date, int(df["id"].iloc[-1]))
+    else:
+        state["next_cursor"] = None
+
+    if df.empty:
+        st.info(empty_msg)
+        return df
+
+    display = df.drop(columns=[f"has_{lazy_text}"]) if lazy_text else df
+    if lazy_text:
+        event = st.dataframe(display, key=f"{key}_table", on_select="rerun",
+                             selection_mode="single-row")
+    else:
+        st.dataframe(display)
+    first_row = (len(state["cursors"]) - 1) * page_size + 1
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("◀ Previous", key=f"{key}_prev", on_click=_page_prev, args=(key,),
+                  disabled=len(state["cursors"]) == 1)
+    with col_info:
+        st.caption(f"Rows {first_row}–{first_row + len(df) - 1} of {total}")
+    with col_next:
+        st.button("Next ▶", key=f"{key}_next", on_click=_page_next, args=(key,),
+                  disabled=not has_next)
+    if lazy_text:
+        show_lazy_text(key, df, event.selection.rows)
+    return df
+
+
+# =========================
+# LAZY SECTIONS
+# =========================
+# Streamlit runs the body of every tab on every rerun. These helpers run
+# only the open tab / expander, so a page fetches just what is on screen;
+# switching reruns the script to fill the newly opened one.
+
+_RERUN_MEMO = contextvars.ContextVar("rerun_memo", default=None)
+
+
+@contextlib.contextmanager
+def rerun_memo():
+    """Scope of rerun_memoized results: one page render."""
+    token = _RERUN_MEMO.set({})
+    try:
+        yield
+    finally:
+        _RERUN_MEMO.reset(token)
+
+
+def rerun_memoized(fn):
+    """Share ``fn``'s result between the sections of one render.
+
+    The result is handed out as is, so callers must not modify it. Any
+    write through the data helpers empties the memo.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args):
+        memo = _RERUN_MEMO.get()
+        if memo is None:
+            return fn(*args)
+        key = (fn.__qualname__, args)
+        if key not in memo:
+            memo[key] = fn(*args)
+        return memo[key]
+    return wrapper
+
+
+def lazy_tabs(key, sections):
+    """Tabs from {label: render()} where only the selected tab's render runs."""
+    tabs = st.tabs(list(sections), key=key, on_change="rerun")
+    for tab, render in zip(tabs, sections.values()):
+        if tab.open:
+            with tab:
+                render()
+
+
+def lazy_section(label, key, render, expanded=False):
+    """An expander whose render() only runs while it is open."""
+    section = st.expander(label, expanded=expanded, key=key, on_change="rerun")
+    if section.open:
+        with section:
+            render()
+
+
 # =========================
 # CMMS MASTER DATA (from handbook)
 # =========================
@@ -441,89 +2071,98 @@ def seed_maintenance_master():
     if row["c"] > 0:
         return
 
-    for category, task_name in MAINTENANCE_TASKS:
-        freq_code, interval_days = FREQUENCY_INFO[category]
-        run_query(
-            """
-            INSERT INTO maintenance_master
-            (task_name, frequency, interval_days, category, default_priority, estimated_hours, active)
-            VALUES (%s,%s,%s,%s,%s,%s,%s)
-            """,
-            (task_name, freq_code, interval_days, category, "Medium", 2.0, True),
-            fetch=False,
-        )
+    run_batch(
+        """
+        INSERT INTO maintenance_master
+        (task_name, frequency, interval_days, category, default_priority, estimated_hours, active)
+        VALUES %s
+        """,
+        [
+            (task_name, *FREQUENCY_INFO[category], category, "Medium", 2.0, True)
+            for category, task_name in MAINTENANCE_TASKS
+        ],
+    )
+
+
+def recurrence_dates(start_date: datetime.date, end_date: datetime.date, interval_days: int):
+    """Every date from start_date to end_date (inclusive) stepping by interval_days."""
+    if interval_days <= 0:
+        return []
+    span = (end_date - start_date).days
+    return [start_date + datetime.timedelta(days=k) for k in range(0, span + 1, interval_days)]
 
 
 def generate_cmms_schedule(start_date: datetime.date, days_ahead: int = 365):
-    """Generate work orders from master tasks within a window."""
+    """Generate work orders from master tasks within a window.
+
+    All recurrences are expanded in memory and written with one batched
+    insert; existing (master_id, due_date) pairs are skipped by the unique
+    key. Returns (rows inserted, seconds taken).
+    """
+    started = time.perf_counter()
     end_date = start_date + datetime.timedelta(days=days_ahead)
     masters = run_query(
         "SELECT id, interval_days, default_priority FROM maintenance_master WHERE active=TRUE",
         fetch=True,
     )
-    if not masters:
-        return
-
-    for m in masters:
-        mid = m["id"]
-        interval = int(m["interval_days"])
-        priority = m["default_priority"] or "Medium"
-        d = start_date
-        while d <= end_date:
-            existing = run_query(
-                "SELECT id FROM maintenance_workorders WHERE master_id=%s AND due_date=%s LIMIT 1",
-                (mid, d),
-                fetch=True,
-            )
-            if not existing:
-                run_query(
-                    """
-                    INSERT INTO maintenance_workorders
-                    (master_id, due_date, status, priority, estimated_hours)
-                    VALUES (%s,%s,'Pending',%s,%s)
-                    """,
-                    (mid, d, priority, 2.0),
-                    fetch=False,
-                )
-            d += datetime.timedelta(days=interval)
+    rows = [
+        (m["id"], d, "Pending", m["default_priority"] or "Medium", 2.0)
+        for m in masters or []
+        for d in recurrence_dates(start_date, end_date, int(m["interval_days"]))
+    ]
+    inserted = run_batch(
+        """
+        INSERT INTO maintenance_workorders
+        (master_id, due_date, status, priority, estimated_hours)
+        VALUES %s
+        ON CONFLICT (master_id, due_date) DO NOTHING
+        """,
+        rows,
+    )
+    return inserted, time.perf_counter() - started
 
 
 # =========================
 # OPERATOR TO-DO HELPERS
 # =========================
 
-def generate_todo_schedule(operator_name: str, days_ahead: int = 60):
-    """Generate to-do checklist items for an operator."""
+def generate_todo_schedule(operator_name: str = None, days_ahead: int = 60):
+    """Generate to-do checklist items for one operator, or all when None.
+
+    Returns (rows inserted, seconds taken); items that already exist for a
+    (master_id, due_date) pair are left untouched.
+    """
+    started = time.perf_counter()
     today = datetime.date.today()
     end_date = today + datetime.timedelta(days=days_ahead)
-    masters = run_query(
+    if operator_name is None:
+        masters = run_query(
+            "SELECT id, interval_days FROM operator_todo_master WHERE active=TRUE",
+            fetch=True,
+        )
+    else:
+        masters = run_query(
+            """
+            SELECT id, interval_days FROM operator_todo_master
+            WHERE active=TRUE AND operator_name=%s
+            """,
+            (operator_name,),
+            fetch=True,
+        )
+    rows = [
+        (m["id"], d, "Pending")
+        for m in masters or []
+        for d in recurrence_dates(today, end_date, int(m["interval_days"]))
+    ]
+    inserted = run_batch(
         """
-        SELECT id, interval_days FROM operator_todo_master
-        WHERE active=TRUE AND operator_name=%s
+        INSERT INTO operator_todo_items (master_id, due_date, status)
+        VALUES %s
+        ON CONFLICT (master_id, due_date) DO NOTHING
         """,
-        (operator_name,),
-        fetch=True,
+        rows,
     )
-    if not masters:
-        return
-
-    for m in masters:
-        mid = m["id"]
-        interval = int(m["interval_days"])
-        d = today
-        while d <= end_date:
-            exists = run_query(
-                "SELECT id FROM operator_todo_items WHERE master_id=%s AND due_date=%s LIMIT 1",
-                (mid, d),
-                fetch=True,
-            )
-            if not exists:
-                run_query(
-                    "INSERT INTO operator_todo_items (master_id, due_date, status) VALUES (%s,%s,'Pending')",
-                    (mid, d),
-                    fetch=False,
-                )
-            d += datetime.timedelta(days=interval)
+    return inserted, time.perf_counter() - started
 
 
 # Chemicals list
@@ -534,6 +2173,38 @@ CHEMICALS = ["HCL", "BC", "Chlorine"]
 # DASHBOARD PAGE
 # =========================
 
+# Every figure on the dashboard in one round-trip, as (kind, item, item_date, value) rows.
+DASHBOARD_SQL = """
+WITH latest_cart AS (
+    SELECT entry_date, diff_pressure FROM cartridge_filters
+    ORDER BY entry_date DESC, id DESC LIMIT 1
+),
+latest_wq AS (
+    SELECT sample_date, tds, ph FROM water_quality
+    WHERE point = 'Permeate'
+    ORDER BY sample_date DESC, sample_time DESC, id DESC LIMIT 1
+)
+SELECT 'prod' AS kind, NULL AS item, prod_date AS item_date, prod_value AS value
+FROM daily_production WHERE prod_date >= %(month_start)s AND prod_date <= %(today)s
+UNION ALL
+SELECT 'lifetime', NULL, NULL, COALESCE(SUM(prod_value), 0) FROM daily_production
+UNION ALL
+SELECT 'cartridge_dp', NULL, entry_date, diff_pressure FROM latest_cart
+UNION ALL
+SELECT 'stock', chemical, NULL, COALESCE(stock_qty, 0) FROM chemicals_stock
+UNION ALL
+SELECT 'permeate_tds', NULL, sample_date, tds FROM latest_wq
+UNION ALL
+SELECT 'permeate_ph', NULL, sample_date, ph FROM latest_wq
+UNION ALL
+SELECT 'cmms_overdue', NULL, NULL, COUNT(*) FROM maintenance_workorders
+WHERE status = 'Pending' AND due_date < %(today)s
+UNION ALL
+SELECT 'cmms_next14', NULL, NULL, COUNT(*) FROM maintenance_workorders
+WHERE status = 'Pending' AND due_date BETWEEN %(today)s AND %(next14)s
+"""
+
+
 def page_dashboard():
     apply_theme()
     st.markdown("<div class='top-title'>RO Plant – Emerald Dashboard</div>", unsafe_allow_html=True)
@@ -545,10 +2216,24 @@ def page_dashboard():
     today = datetime.date.today()
     first_month = today.replace(day=1)
 
+    kpi = fetch_df(
+        DASHBOARD_SQL,
+        {"month_start": first_month, "today": today,
+         "next14": today + datetime.timedelta(days=14)},
+    )
+    profile_mark("transform")
+    kpi["value"] = pd.to_numeric(kpi["value"])
+
+    def kpi_value(kind):
+        """Value of a single-row KPI, or None when there is no row for it."""
+        rows = kpi.loc[kpi["kind"] == kind, "value"]
+        if rows.empty:
+            return None
+        return 0.0 if pd.isna(rows.iloc[0]) else float(rows.iloc[0])
+
     # Production (month & lifetime)
-    df_prod = fetch_df(
-        "SELECT * FROM daily_production WHERE prod_date >= %s AND prod_date <= %s ORDER BY prod_date",
-        (first_month, today),
+    df_prod = kpi.loc[kpi["kind"] == "prod", ["item_date", "value"]].rename(
+        columns={"item_date": "prod_date", "value": "prod_value"}
     )
     if df_prod.empty:
         today_val = 0.0
@@ -558,16 +2243,13 @@ def page_dashboard():
         today_val = float(df_prod[df_prod["prod_date"].dt.date == today]["prod_value"].sum())
         month_total = float(df_prod["prod_value"].sum())
 
-    df_life = fetch_df("SELECT COALESCE(SUM(prod_value),0) AS tot FROM daily_production")
-    lifetime = float(df_life["tot"].iloc[0]) if not df_life.empty else 0.0
+    lifetime = kpi_value("lifetime") or 0.0
 
     # Cartridge latest
-    df_cart = fetch_df("SELECT * FROM cartridge_filters ORDER BY entry_date DESC, id DESC LIMIT 1")
     cart_status = "No data"
     cart_class = ""
-    diff_val = None
-    if not df_cart.empty:
-        diff_val = float(df_cart["diff_pressure"].iloc[0] or 0)
+    diff_val = kpi_value("cartridge_dp")
+    if diff_val is not None:
         if diff_val < 1:
             cart_status = "OK (<1 bar)"
             cart_class = "status-ok"
@@ -579,12 +2261,10 @@ def page_dashboard():
             cart_class = "status-alarm"
 
     # Chemical stock alerts
-    df_stock = fetch_df(
-        "SELECT chemical, COALESCE(stock_qty,0) AS stock_qty FROM chemicals_stock ORDER BY chemical"
-    )
+    df_stock = kpi.loc[kpi["kind"] == "stock"].sort_values("item")
     low_chems = []
     for _, row in df_stock.iterrows():
-        q = float(row["stock_qty"] or 0)
+        q = float(row["value"] or 0)
         lvl = None
         if q <= 0:
             lvl = "Empty"
@@ -593,34 +2273,18 @@ def page_dashboard():
         elif q < 100:
             lvl = "Low <100 kg"
         if lvl:
-            low_chems.append(f"{row['chemical']}: {lvl} (current {q:.1f} kg)")
+            low_chems.append(f"{row['item']}: {lvl} (current {q:.1f} kg)")
 
     # Latest permeate water quality
-    df_wq = fetch_df(
-        "SELECT * FROM water_quality WHERE point=%s "
-        "ORDER BY sample_date DESC, sample_time DESC, id DESC LIMIT 1",
-        ("Permeate",),
-    )
-    last_tds = last_ph = None
-    if not df_wq.empty:
-        last_tds = float(df_wq["tds"].iloc[0] or 0)
-        last_ph = float(df_wq["ph"].iloc[0] or 0)
+    last_tds = kpi_value("permeate_tds")
+    last_ph = kpi_value("permeate_ph")
 
     # CMMS counts
-    df_overdue = fetch_df(
-        "SELECT COUNT(*) AS c FROM maintenance_workorders "
-        "WHERE status='Pending' AND due_date < %s",
-        (today,),
-    )
-    df_next14 = fetch_df(
-        "SELECT COUNT(*) AS c FROM maintenance_workorders "
-        "WHERE status='Pending' AND due_date BETWEEN %s AND %s",
-        (today, today + datetime.timedelta(days=14)),
-    )
-    overdue_count = int(df_overdue["c"].iloc[0]) if not df_overdue.empty else 0
-    next14_count = int(df_next14["c"].iloc[0]) if not df_next14.empty else 0
+    overdue_count = int(kpi_value("cmms_overdue") or 0)
+    next14_count = int(kpi_value("cmms_next14") or 0)
 
     # KPI cards
+    profile_mark("render")
     c1, c2, c3, c4, c5, c6 = st.columns(6)
     with c1:
         st.markdown(
@@ -697,10 +2361,156 @@ def page_dashboard():
             st.error(f"Cartridge filter ΔP high: {diff_val:.2f} bar – change filter.")
         elif diff_val is not None and diff_val >= 1:
             st.warning(f"Cartridge filter ΔP elevated: {diff_val:.2f} bar – monitor.")
+
+
 # =========================
 # FLOWMETER & PRODUCTION PAGES
 # =========================
 
+def compute_daily_production(readings: pd.DataFrame, base=None) -> pd.DataFrame:
+    """Daily production and month / total cumulatives from totalizer readings.
+
+    The first reading produces 0 and negative steps (meter reset or
+    correction) are clamped to 0. ``base`` continues an existing series: a
+    mapping with the previous reading's reading_date, reading_value,
+    cumulative_month and cumulative_total.
+    """
+    df = readings.sort_values("reading_date")
+    dates = pd.to_datetime(df["reading_date"])
+    values = pd.to_numeric(df["reading_value"]).astype(float)
+    prev = values.shift(1)
+    if base is not None and not prev.empty:
+        prev.iloc[0] = float(base["reading_value"])
+    prod = (values - prev).clip(lower=0.0).fillna(0.0)
+    month = dates.dt.to_period("M")
+    cum_month = prod.groupby(month.to_numpy()).cumsum()
+    cum_total = prod.cumsum()
+    if base is not None:
+        base_month = pd.Timestamp(base["reading_date"]).to_period("M")
+        cum_month = cum_month + (month == base_month) * float(base["cumulative_month"] or 0)
+        cum_total = cum_total + float(base["cumulative_total"] or 0)
+    return pd.DataFrame({
+        "prod_date": dates.dt.date.to_numpy(),
+        "prod_value": prod.to_numpy(),
+        "cumulative_month": cum_month.to_numpy(),
+        "cumulative_total": cum_total.to_numpy(),
+    })
+
+
+def _write_daily_production(cur, prod: pd.DataFrame, start_date=None):
+    """Replace daily_production rows from start_date on (all when None) with ``prod``."""
+    if start_date is None:
+        cur.execute("DELETE FROM daily_production")
+    else:
+        cur.execute("DELETE FROM daily_production WHERE prod_date >= %s", (start_date,))
+    insert_values(
+        cur,
+        """
+        INSERT INTO daily_production
+        (prod_date, prod_value, cumulative_month, cumulative_total)
+        VALUES %s
+        """,
+        list(prod.itertuples(index=False, name=None)),
+        page_size=5000,
+    )
+
+
+def rebuild_daily_production():
+    """Recompute daily_production from every flowmeter reading.
+
+    The delete and the bulk insert share one transaction, so readers keep
+    seeing the previous figures until the new ones are committed. Returns
+    the number of days written, or None with fewer than 2 readings.
+    """
+    readings = fetch_df(
+        "SELECT reading_date, reading_value FROM flowmeter_readings ORDER BY reading_date"
+    )
+    if readings.shape[0] < 2:
+        return None
+    prod = compute_daily_production(readings)
+
+    def work(conn):
+        with conn.cursor() as cur:
+            _write_daily_production(cur, prod)
+        conn.commit()
+
+    try:
+        with_connection(work)
+    finally:
+        invalidate_tables("daily_production")
+    return len(prod)
+
+
+def _refresh_daily_production(cur, start_date):
+    """Recompute daily_production from start_date on inside the caller's transaction.
+
+    Continues from the stored production row of the reading before
+    start_date; falls back to a full rebuild when that row has never been
+    calculated. ``cur`` must be a RealDictCursor.
+    """
+    cur.execute(
+        "SELECT reading_date, reading_value FROM flowmeter_readings "
+        "WHERE reading_date < %s ORDER BY reading_date DESC LIMIT 1",
+        (start_date,),
+    )
+    prev = cur.fetchone()
+    base = None
+    if prev is not None:
+        cur.execute(
+            "SELECT cumulative_month, cumulative_total FROM daily_production "
+            "WHERE prod_date=%s",
+            (prev["reading_date"],),
+        )
+        cum = cur.fetchone()
+        if cum is None:
+            start_date = None
+        else:
+            base = {**prev, **cum}
+
+    if start_date is None:
+        cur.execute(
+            "SELECT reading_date, reading_value FROM flowmeter_readings "
+            "ORDER BY reading_date"
+        )
+    else:
+        cur.execute(
+            "SELECT reading_date, reading_value FROM flowmeter_readings "
+            "WHERE reading_date >= %s ORDER BY reading_date",
+            (start_date,),
+        )
+    readings = pd.DataFrame(cur.fetchall(), columns=["reading_date", "reading_value"])
+    _write_daily_production(cur, compute_daily_production(readings, base), start_date)
+
+
+def save_flowmeter_reading(reading_date, reading_value, operator=None, notes=None):
+    """Upsert one reading and refresh daily_production incrementally.
+
+    Only the saved day, the following days' step and the cumulative columns
+    from that date forward are recomputed. Everything runs in one
+    transaction.
+    """
+    def work(conn):
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                INSERT INTO flowmeter_readings (reading_date, reading_value, operator, notes)
+                VALUES (%s,%s,%s,%s)
+                ON CONFLICT (reading_date)
+                DO UPDATE SET reading_value=EXCLUDED.reading_value,
+                              operator=EXCLUDED.operator,
+                              notes=EXCLUDED.notes;
+                """,
+                (reading_date, reading_value, operator, notes),
+            )
+            _refresh_daily_production(cur, reading_date)
+        conn.commit()
+
+    try:
+        with_connection(work)
+    finally:
+        invalidate_tables("flowmeter_readings", "daily_production")
+
+
 def page_flowmeter():
     apply_theme()
     st.markdown("<div class='top-title'>Flowmeter Readings</div>", unsafe_allow_html=True)
@@ -716,73 +2526,82 @@ def page_flowmeter():
         notes = st.text_area("Notes", "")
 
         if st.button("💾 Save Reading"):
-            run_query(
-                """
-                INSERT INTO flowmeter_readings (reading_date, reading_value, operator, notes)
-                VALUES (%s,%s,%s,%s)
-                ON CONFLICT (reading_date)
-                DO UPDATE SET reading_value=EXCLUDED.reading_value,
-                              operator=EXCLUDED.operator,
-                              notes=EXCLUDED.notes;
-                """,
-                (date_val, reading, operator or None, notes or None),
-                fetch=False,
-            )
-            st.success("Reading saved / updated.")
+            save_flowmeter_reading(date_val, reading, operator or None, notes or None)
+            st.success("Reading saved / updated; daily production refreshed.")
 
     with col_table:
         st.subheader("History")
         days_back = st.slider("Show last N days", 7, 120, 30)
         start_date = datetime.date.today() - datetime.timedelta(days=days_back)
-        df = fetch_df(
-            "SELECT * FROM flowmeter_readings WHERE reading_date >= %s ORDER BY reading_date DESC",
-            (start_date,),
+        paginated_table(
+            "flowmeter_history", "reading_date",
+            where="reading_date >= %s", params=(start_date,),
+            empty_msg="No readings for selected period.",
         )
-        if df.empty:
-            st.info("No readings for selected period.")
-        else:
-            st.dataframe(df)
 
     st.markdown("---")
     st.subheader("Generate Daily Production from Flowmeter")
 
     if st.button("⚙️ Recalculate Daily Production from all readings"):
-        df_all = fetch_df("SELECT * FROM flowmeter_readings ORDER BY reading_date")
-        if df_all.shape[0] < 2:
+        written = rebuild_daily_production()
+        if written is None:
             st.warning("Need at least 2 readings to calculate daily production.")
         else:
-            run_query("DELETE FROM daily_production;", fetch=False)
-            last_val = None
-            current_month = None
-            cumulative_month = 0.0
-            cumulative_total = 0.0
-
-            for _, row in df_all.iterrows():
-                d = row["reading_date"]
-                val = float(row["reading_value"])
-                if last_val is None:
-                    prod = 0.0
-                else:
-                    prod = max(val - last_val, 0.0)
-                last_val = val
-
-                if current_month is None or d.month != current_month.month or d.year != current_month.year:
-                    cumulative_month = prod
-                    current_month = d
-                else:
-                    cumulative_month += prod
-                cumulative_total += prod
+            st.success(f"Daily production recalculated from flowmeter readings ({written} days).")
+
+
+def month_start_sql(column):
+    """SQL for the first day of the month of a DATE column, per backend."""
+    if DB_BACKEND == "sqlite":
+        return f"date({column}, 'start of month')"
+    return f"CAST(date_trunc('month', {column}) AS DATE)"
+
+
+PRODUCTION_REPORT_SQL = (
+    f"SELECT {view_select('production_report')} FROM daily_production "
+    "WHERE prod_date >= %s AND prod_date <= %s ORDER BY prod_date"
+)
+
+
+def fetch_production_report(start_date, end_date):
+    return fetch_df(PRODUCTION_REPORT_SQL, (start_date, end_date))
 
-                run_query(
-                    """
-                    INSERT INTO daily_production
-                    (prod_date, prod_value, cumulative_month, cumulative_total)
-                    VALUES (%s,%s,%s,%s)
-                    """,
-                    (d, prod, cumulative_month, cumulative_total),
-                    fetch=False,
-                )
-            st.success("Daily production recalculated from flowmeter readings.")
+
+# Report builders run through cached_export() with the daily_production version
+# as an argument, so a report is built once per click and re-served until the
+# data changes or the export cache needs the room.
+def production_report_xlsx(start_date, end_date, data_version):
+    period = (start_date, end_date)
+    return export_query_to_excel([
+        ("Production", PRODUCTION_REPORT_SQL, period),
+        (
+            "Monthly",
+            f"SELECT {month_start_sql('prod_date')} AS month, "
+            "SUM(prod_value) AS production, COUNT(*) AS days, "
+            "MAX(cumulative_total) AS cumulative_total "
+            "FROM daily_production WHERE prod_date >= %s AND prod_date <= %s "
+            "GROUP BY 1 ORDER BY 1",
+            period,
+        ),
+    ]).read()
+
+
+def production_report_pdf(start_date, end_date, data_version):
+    df = fetch_production_report(start_date, end_date)
+    df["prod_date"] = pd.to_datetime(df["prod_date"])
+    daily = pd.to_numeric(df["prod_value"])
+    return export_table_pdf(
+        "RO Production Report",
+        df,
+        subtitle=f"Production report from {start_date} to {end_date}",
+        summary=[
+            ("Total production", f"{daily.sum():,.1f} m³"),
+            ("Average per day", f"{daily.mean():,.1f} m³"),
+            ("Best day", f"{daily.max():,.1f} m³"),
+            ("Days", f"{len(df)}"),
+        ],
+        chart=("Daily Production (m³)", daily.set_axis(df["prod_date"].dt.date)),
+    ).getvalue()
 
 
 def page_production():
@@ -797,16 +2616,15 @@ def page_production():
     with col2:
         end_date = st.date_input("To date", today)
 
-    df = fetch_df(
-        "SELECT * FROM daily_production WHERE prod_date >= %s AND prod_date <= %s ORDER BY prod_date",
-        (start_date, end_date),
-    )
+    df = fetch_production_report(start_date, end_date)
     if df.empty:
         st.info("No production records for selected period.")
         return
 
+    profile_mark("transform")
     df["prod_date"] = pd.to_datetime(df["prod_date"])
 
+    profile_mark("render")
     st.subheader("Production Table")
     st.dataframe(df)
 
@@ -822,32 +2640,50 @@ def page_production():
     st.markdown("---")
     st.subheader("Export")
 
-    buf_x = export_df_to_excel(df, sheet_name="Production")
-    st.download_button(
-        "⬇️ Download production_report.xlsx",
-        data=buf_x.getvalue(),
-        file_name="production_report.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-
-    lines = [f"Production report from {start_date} to {end_date}", ""]
-    for _, r in df.iterrows():
-        lines.append(
-            f"{r['prod_date'].date()}  -  {r['prod_value']} m³  (Cum: {r['cumulative_total']})"
-        )
-    buf_p = export_simple_pdf("RO Production Report", lines)
-    st.download_button(
-        "⬇️ Download production_report.pdf",
-        data=buf_p.getvalue(),
-        file_name="production_report.pdf",
-        mime="application/pdf",
-    )
+    # Reports are built only on request; a request holds while the range and data are unchanged
+    request = (start_date, end_date, get_query_cache().versions(["daily_production"]))
+    requested = st.session_state.setdefault("production_exports", {})
+    col_x, col_p = st.columns(2)
+    with col_x:
+        if st.button("📊 Prepare production_report.xlsx"):
+            requested["xlsx"] = request
+        if requested.get("xlsx") == request:
+            st.download_button(
+                "⬇️ Download production_report.xlsx",
+                data=cached_export(production_report_xlsx, *request),
+                file_name="production_report.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                on_click="ignore",
+            )
+    with col_p:
+        if st.button("📄 Prepare production_report.pdf"):
+            requested["pdf"] = request
+        if requested.get("pdf") == request:
+            try:
+                data = cached_export(production_report_pdf, *request)
+            except RuntimeError as exc:
+                st.warning(f"PDF report unavailable: {exc}")
+            else:
+                st.download_button(
+                    "⬇️ Download production_report.pdf",
+                    data=data,
+                    file_name="production_report.pdf",
+                    mime="application/pdf",
+                    on_click="ignore",
+                )
 
 
 # =========================
 # CHEMICALS – STOCK, COST & MOVEMENTS (HCL / BC / Chlorine)
 # =========================
 
+# Balance and unit cost a new movement continues from
+LAST_MOVEMENT_SQL = (
+    "SELECT balance, unit_cost FROM chemicals_movement WHERE chemical=%s "
+    "ORDER BY movement_date DESC, id DESC LIMIT 1"
+)
+
+
 def page_chemicals():
     apply_theme()
     st.markdown("<div class='top-title'>Chemicals – Stock, Cost & Movements</div>", unsafe_allow_html=True)
@@ -863,12 +2699,8 @@ def page_chemicals():
         unsafe_allow_html=True,
     )
 
-    tab_stock, tab_inout, tab_hist = st.tabs(
-        ["📦 Stock & Cost", "➕ Record IN / OUT", "📜 Movements History"]
-    )
-
     # TAB 1 – Stock & Cost
-    with tab_stock:
+    def stock_tab():
         st.subheader("Current Stock and Value")
         df_stock = fetch_df(
             "SELECT chemical AS name, stock_qty AS qty, "
@@ -905,6 +2737,7 @@ def page_chemicals():
                 row = fetch_df(
                     "SELECT stock_qty FROM chemicals_stock WHERE chemical=%s",
                     (chem_sel,),
+                    cache=False,
                 )
                 qty = float(row["stock_qty"].iloc[0]) if not row.empty else 0.0
                 stock_val = qty * new_cost
@@ -923,7 +2756,7 @@ def page_chemicals():
                 st.success(f"Cost for {chem_sel} updated to {new_cost:.2f}.")
 
     # TAB 2 – Record IN/OUT
-    with tab_inout:
+    def movement_tab():
         st.subheader("Record IN / OUT Movement")
         col_f1, col_f2 = st.columns(2)
         with col_f1:
@@ -938,9 +2771,9 @@ def page_chemicals():
 
         if st.button("💾 Save Movement"):
             df_last = fetch_df(
-                "SELECT balance, unit_cost FROM chemicals_movement WHERE chemical=%s "
-                "ORDER BY movement_date DESC, id DESC LIMIT 1",
+                LAST_MOVEMENT_SQL,
                 (chem,),
+                cache=False,
             )
             last_bal = float(df_last["balance"].iloc[0]) if not df_last.empty else 0.0
             last_cost = float(df_last["unit_cost"].iloc[0]) if not df_last.empty else 0.0
@@ -979,21 +2812,21 @@ def page_chemicals():
             )
 
     # TAB 3 – History
-    with tab_hist:
+    def history_tab():
         st.subheader("Movements History")
         days_back = st.slider("Show last N days", 7, 180, 60)
         start_date = datetime.date.today() - datetime.timedelta(days=days_back)
-        df = fetch_df(
-            "SELECT movement_date, chemical, qty_in, qty_out, balance, "
-            "unit_cost, stock_value, operator, notes "
-            "FROM chemicals_movement WHERE movement_date >= %s "
-            "ORDER BY movement_date DESC, id DESC",
-            (start_date,),
+        paginated_table(
+            "chem_history", "movement_date",
+            where="movement_date >= %s", params=(start_date,),
+            empty_msg="No chemical movements for selected period.",
         )
-        if df.empty:
-            st.info("No chemical movements for selected period.")
-        else:
-            st.dataframe(df)
+
+    lazy_tabs("chem_tab", {
+        "📦 Stock & Cost": stock_tab,
+        "➕ Record IN / OUT": movement_tab,
+        "📜 Movements History": history_tab,
+    })
 
 
 # =========================
@@ -1056,15 +2889,13 @@ def page_filters():
         st.subheader("History")
         days_back = st.slider("Show last N days", 7, 120, 30)
         start_date = datetime.date.today() - datetime.timedelta(days=days_back)
-        df = fetch_df(
-            "SELECT * FROM cartridge_filters WHERE entry_date >= %s "
-            "ORDER BY entry_date DESC, id DESC",
-            (start_date,),
+        paginated_table(
+            "filters_history", "entry_date",
+            where="entry_date >= %s", params=(start_date,),
+            empty_msg="No cartridge filter logs for selected period.",
         )
-        if df.empty:
-            st.info("No cartridge filter logs for selected period.")
-        else:
-            st.dataframe(df)
+
+
 # =========================
 # SIMPLE MAINTENANCE LOG
 # =========================
@@ -1101,15 +2932,11 @@ def page_maintenance_log():
         st.subheader("Recent Maintenance")
         days_back = st.slider("Show last N days", 30, 365, 90)
         start_date = datetime.date.today() - datetime.timedelta(days=days_back)
-        df = fetch_df(
-            "SELECT * FROM maintenance_log WHERE maint_date >= %s "
-            "ORDER BY maint_date DESC, id DESC",
-            (start_date,),
+        paginated_table(
+            "maint_history", "maint_date",
+            where="maint_date >= %s", params=(start_date,),
+            empty_msg="No maintenance records for selected period.",
         )
-        if df.empty:
-            st.info("No maintenance records for selected period.")
-        else:
-            st.dataframe(df)
 
 
 # =========================
@@ -1148,17 +2975,76 @@ def page_system_status():
 
     with col_table:
         st.subheader("Recent Status Log")
-        df = fetch_df("SELECT * FROM system_status ORDER BY status_time DESC LIMIT 100")
-        if df.empty:
-            st.info("No status snapshots logged yet.")
-        else:
-            st.dataframe(df)
+        paginated_table(
+            "status_history", "status_time",
+            empty_msg="No status snapshots logged yet.",
+        )
 
 
 # =========================
 # WATER QUALITY PAGE
 # =========================
 
+# Permeate trend: stats per time bucket, computed server-side (index-only scan on
+# water_quality_point_ts_idx) so the row count stays bounded whatever the history size.
+QUALITY_TREND_SQL = """
+SELECT TIMESTAMP 'epoch'
+       + FLOOR(EXTRACT(EPOCH FROM sample_date + COALESCE(sample_time, TIME '00:00'))
+               / %(bucket)s) * %(bucket)s * INTERVAL '1 second' AS ts,
+       MIN(tds) AS tds_min, AVG(tds) AS tds_mean, MAX(tds) AS tds_max,
+       MIN(ph) AS ph_min, AVG(ph) AS ph_mean, MAX(ph) AS ph_max,
+       COUNT(*) AS samples
+FROM water_quality
+WHERE point = %(point)s AND sample_date BETWEEN %(start)s AND %(end)s
+GROUP BY 1
+ORDER BY 1
+"""
+
+# Same buckets in SQLite: integer division of Unix seconds
+QUALITY_TREND_SQL_SQLITE = """
+SELECT datetime(
+           CAST(strftime('%%s', sample_date || ' ' || COALESCE(sample_time, '00:00:00')) AS INTEGER)
+           / %(bucket)s * %(bucket)s, 'unixepoch') AS ts,
+       MIN(tds) AS tds_min, AVG(tds) AS tds_mean, MAX(tds) AS tds_max,
+       MIN(ph) AS ph_min, AVG(ph) AS ph_mean, MAX(ph) AS ph_max,
+       COUNT(*) AS samples
+FROM water_quality
+WHERE point = %(point)s AND sample_date BETWEEN %(start)s AND %(end)s
+GROUP BY 1
+ORDER BY 1
+"""
+
+TREND_RANGES = {
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+    "Last 90 days": 90,
+    "Last year": 365,
+    "All history": None,
+}
+TREND_TARGET_POINTS = 500
+
+SAMPLE_POINTS = ["Feed", "Permeate", "Reject"]
+
+
+def fetch_quality_trend(point, start_date, end_date, target_points=TREND_TARGET_POINTS):
+    """Min / mean / max TDS and pH per time bucket for one sampling point.
+
+    The bucket width is chosen from the date range so that at most about
+    ``target_points`` rows come back. Returns (DataFrame, bucket seconds).
+    """
+    span_seconds = ((end_date - start_date).days + 1) * 86400
+    bucket = max(-(-span_seconds // target_points), 60)
+    df = fetch_df(
+        QUALITY_TREND_SQL_SQLITE if DB_BACKEND == "sqlite" else QUALITY_TREND_SQL,
+        {"bucket": bucket, "point": point, "start": start_date, "end": end_date},
+    )
+    with profile_phase("transform"):
+        df["ts"] = pd.to_datetime(df["ts"])
+        stat_cols = [c for c in df.columns if c not in ("ts", "samples")]
+        df[stat_cols] = df[stat_cols].apply(pd.to_numeric)
+    return df, bucket
+
+
 def page_water_quality():
     apply_theme()
     st.markdown("<div class='top-title'>Water Quality Monitoring</div>", unsafe_allow_html=True)
@@ -1169,13 +3055,11 @@ def page_water_quality():
 
     col_form, col_table = st.columns([1, 2])
 
-    sample_points = ["Feed", "Permeate", "Reject"]
-
     with col_form:
         st.subheader("Log Water Quality Sample")
         d = st.date_input("Sample Date", datetime.date.today())
         t = st.time_input("Sample Time", datetime.datetime.now().time())
-        point = st.selectbox("Sampling Point", sample_points)
+        point = st.selectbox("Sampling Point", SAMPLE_POINTS)
         tds = st.number_input("TDS (ppm)", min_value=0.0, step=1.0)
         ph = st.number_input("pH", min_value=0.0, max_value=14.0, step=0.1)
         cond = st.number_input("Conductivity (µS/cm)", min_value=0.0, step=1.0)
@@ -1201,42 +3085,100 @@ def page_water_quality():
         st.subheader("Recent Water Quality Samples")
         days_back = st.slider("Show last N days", 7, 90, 30)
         start_date = datetime.date.today() - datetime.timedelta(days=days_back)
-        df = fetch_df(
-            "SELECT * FROM water_quality WHERE sample_date >= %s "
-            "ORDER BY sample_date DESC, sample_time DESC, id DESC",
-            (start_date,),
+        paginated_table(
+            "wq_history", "sample_date",
+            where="sample_date >= %s", params=(start_date,),
+            empty_msg="No water quality data for selected period.",
         )
-        if df.empty:
-            st.info("No water quality data for selected period.")
-        else:
-            st.dataframe(df)
 
     st.markdown("---")
     st.subheader("Permeate TDS & pH Trend")
 
-    df_perm = fetch_df(
-        "SELECT sample_date, sample_time, tds, ph "
-        "FROM water_quality WHERE point=%s ORDER BY sample_date, sample_time",
-        ("Permeate",),
-    )
+    today = datetime.date.today()
+    range_label = st.selectbox("Trend range", list(TREND_RANGES), index=1)
+    days = TREND_RANGES[range_label]
+    if days is None:
+        df_first = fetch_df(
+            "SELECT MIN(sample_date) AS first_date FROM water_quality WHERE point=%s",
+            ("Permeate",),
+        )
+        first_date = df_first["first_date"].iloc[0]
+        trend_start = first_date if pd.notna(first_date) else today
+    else:
+        trend_start = today - datetime.timedelta(days=days)
+
+    df_perm, bucket = fetch_quality_trend("Permeate", trend_start, today)
     if df_perm.empty:
         st.info("No permeate quality data yet.")
     else:
-        df_perm["ts"] = pd.to_datetime(
-            df_perm["sample_date"].astype(str) + " " + df_perm["sample_time"].astype(str)
-        )
         df_perm = df_perm.set_index("ts")
+        st.caption(
+            f"{int(df_perm['samples'].sum())} samples in {len(df_perm)} buckets of "
+            f"{datetime.timedelta(seconds=int(bucket))} (min / mean / max per bucket)"
+        )
         col1, col2 = st.columns(2)
         with col1:
             st.caption("Permeate TDS (ppm)")
-            st.line_chart(df_perm["tds"])
+            st.line_chart(df_perm[["tds_min", "tds_mean", "tds_max"]])
         with col2:
             st.caption("Permeate pH")
-            st.line_chart(df_perm["ph"])
+            st.line_chart(df_perm[["ph_min", "ph_mean", "ph_max"]])
+
+
 # =========================
 # ADVANCED CMMS PAGE (WORK ORDERS)
 # =========================
 
+# Headline counts in one round-trip; each subquery is served by a status index
+CMMS_COUNTS_SQL = """
+SELECT
+    (SELECT COUNT(*) FROM maintenance_workorders
+     WHERE status = 'Pending' AND due_date < %(today)s) AS overdue,
+    (SELECT COUNT(*) FROM maintenance_workorders
+     WHERE status = 'Pending' AND due_date BETWEEN %(today)s AND %(next14)s) AS upcoming,
+    (SELECT COUNT(*) FROM maintenance_workorders
+     WHERE status = 'Completed' AND completion_date >= %(since)s) AS completed
+"""
+
+# Work orders behind each Overview tab; same parameters as CMMS_COUNTS_SQL
+CMMS_LIST_SQL = {
+    "overdue": """
+        SELECT w.id, m.task_name, w.due_date, w.priority
+        FROM maintenance_workorders w
+        JOIN maintenance_master m ON w.master_id = m.id
+        WHERE w.status = 'Pending' AND w.due_date < %(today)s
+        ORDER BY w.due_date
+    """,
+    "upcoming": """
+        SELECT w.id, m.task_name, w.due_date, w.priority
+        FROM maintenance_workorders w
+        JOIN maintenance_master m ON w.master_id = m.id
+        WHERE w.status = 'Pending' AND w.due_date BETWEEN %(today)s AND %(next14)s
+        ORDER BY w.due_date
+    """,
+    "completed": """
+        SELECT w.id, m.task_name, w.due_date, w.completion_date, w.cost
+        FROM maintenance_workorders w
+        JOIN maintenance_master m ON w.master_id = m.id
+        WHERE w.status = 'Completed' AND w.completion_date >= %(since)s
+        ORDER BY w.completion_date DESC
+    """,
+}
+
+
+def cmms_params(today):
+    """Parameters of CMMS_COUNTS_SQL and CMMS_LIST_SQL as of ``today``."""
+    return {"today": today, "next14": today + datetime.timedelta(days=14),
+            "since": today - datetime.timedelta(days=30)}
+
+
+@rerun_memoized
+def fetch_cmms_counts(today):
+    """{"overdue", "upcoming", "completed"} work-order counts as of ``today``."""
+    row = fetch_df(CMMS_COUNTS_SQL, cmms_params(today)).iloc[0]
+    return {k: int(row[k]) for k in ("overdue", "upcoming", "completed")}
+
+
 def page_cmms():
     apply_theme()
     st.markdown("<div class='top-title'>RO CMMS – Work Orders</div>", unsafe_allow_html=True)
@@ -1260,70 +3202,51 @@ def page_cmms():
 
         if st.button("Generate / Refresh Schedule"):
             seed_maintenance_master()
-            generate_cmms_schedule(CMMS_START_DATE, days_ahead=int(days_ahead))
-            st.success(f"Schedule generated from {CMMS_START_DATE} for {days_ahead} days.")
+            inserted, elapsed = generate_cmms_schedule(CMMS_START_DATE, days_ahead=int(days_ahead))
+            st.success(
+                f"Schedule generated from {CMMS_START_DATE} for {days_ahead} days: "
+                f"{inserted} new work orders in {elapsed:.2f}s."
+            )
 
     # ---------- Overview ----------
     with col_right:
         st.subheader("Overview")
 
         today = datetime.date.today()
-
-        overdue = fetch_df(
-            """
-            SELECT w.id, m.task_name, w.due_date, w.priority
-            FROM maintenance_workorders w
-            JOIN maintenance_master m ON w.master_id = m.id
-            WHERE w.status = 'Pending' AND w.due_date < %s
-            ORDER BY w.due_date
-            """,
-            (today,),
-        )
-
-        upcoming = fetch_df(
-            """
-            SELECT w.id, m.task_name, w.due_date, w.priority
-            FROM maintenance_workorders w
-            JOIN maintenance_master m ON w.master_id = m.id
-            WHERE w.status = 'Pending' AND w.due_date BETWEEN %s AND %s
-            ORDER BY w.due_date
-            """,
-            (today, today + datetime.timedelta(days=14)),
-        )
-
-        completed = fetch_df(
-            """
-            SELECT w.id, m.task_name, w.due_date, w.completion_date, w.cost
-            FROM maintenance_workorders w
-            JOIN maintenance_master m ON w.master_id = m.id
-            WHERE w.status = 'Completed' AND w.completion_date >= %s
-            ORDER BY w.completion_date DESC
-            """,
-            (today - datetime.timedelta(days=30),),
-        )
+        counts = fetch_cmms_counts(today)
 
         c1, c2, c3 = st.columns(3)
         with c1:
-            st.metric("Overdue", len(overdue))
+            st.metric("Overdue", counts["overdue"])
         with c2:
-            st.metric("Due in next 14 days", len(upcoming))
+            st.metric("Due in next 14 days", counts["upcoming"])
         with c3:
-            st.metric("Completed last 30 days", len(completed))
+            st.metric("Completed last 30 days", counts["completed"])
 
-        tabs = st.tabs(["Overdue", "Upcoming", "Completed"])
-        with tabs[0]:
+        def overdue_tab():
             st.caption("Overdue Work Orders")
-            st.dataframe(overdue)
-        with tabs[1]:
+            st.dataframe(fetch_df(CMMS_LIST_SQL["overdue"], cmms_params(today)))
+
+        def upcoming_tab():
             st.caption("Upcoming Work Orders (14 days)")
-            st.dataframe(upcoming)
-        with tabs[2]:
+            st.dataframe(fetch_df(CMMS_LIST_SQL["upcoming"], cmms_params(today)))
+
+        def completed_tab():
             st.caption("Recently Completed (30 days)")
-            st.dataframe(completed)
+            st.dataframe(fetch_df(CMMS_LIST_SQL["completed"], cmms_params(today)))
+
+        lazy_tabs("cmms_tab", {
+            "Overdue": overdue_tab,
+            "Upcoming": upcoming_tab,
+            "Completed": completed_tab,
+        })
 
     st.markdown("---")
-    st.subheader("Update Work Order")
+    # The picker lists every work order; load it only while the section is open
+    lazy_section("✏️ Update Work Order", "cmms_update", update_workorder_section)
+
 
+def update_workorder_section():
     open_df = fetch_df(
         """
         SELECT w.id, m.task_name, w.due_date, w.priority, w.status
@@ -1337,9 +3260,11 @@ def page_cmms():
         st.info("No work orders yet. Generate schedule first.")
         return
 
-    open_df["label"] = open_df.apply(
-        lambda r: f"{r['id']} | {r['due_date']} | {r['task_name'][:40]}...", axis=1
-    )
+    with profile_phase("transform"):
+        open_df["label"] = (
+            open_df["id"].astype(str) + " | " + open_df["due_date"].astype(str) + " | "
+            + open_df["task_name"].str[:40] + "..."
+        )
 
     selected_label = st.selectbox("Select Work Order", open_df["label"].tolist())
     sel_id = int(selected_label.split("|")[0].strip())
@@ -1391,6 +3316,22 @@ def page_cmms():
 # OPERATOR TO-DO LIST PAGE
 # =========================
 
+# One operator's checklist for one day
+TODO_CHECKLIST_SQL = """
+SELECT i.id, m.title, i.status
+FROM operator_todo_items i
+JOIN operator_todo_master m ON i.master_id = m.id
+WHERE m.operator_name=%s AND i.due_date=%s
+ORDER BY i.id
+"""
+
+
+@rerun_memoized
+def fetch_operators():
+    """All operators (name, role); shared by the list and the picker."""
+    return fetch_df("SELECT name, role FROM operators ORDER BY name")
+
+
 def page_todo():
     apply_theme()
     st.markdown("<div class='top-title'>Operator To-Do List</div>", unsafe_allow_html=True)
@@ -1420,7 +3361,7 @@ def page_todo():
                 st.success(f"Operator {op_name} added.")
 
     with col_b:
-        df_ops = fetch_df("SELECT name, role FROM operators ORDER BY name")
+        df_ops = fetch_operators()
         if df_ops.empty:
             st.info("No operators yet. Add one on the left.")
         else:
@@ -1428,19 +3369,15 @@ def page_todo():
 
     st.markdown("---")
 
-    df_ops = fetch_df("SELECT name FROM operators ORDER BY name")
+    df_ops = fetch_operators()
     if df_ops.empty:
         st.warning("Add at least one operator to start defining to-do tasks.")
         return
 
     operator_selected = st.selectbox("Select operator for to-do list", df_ops["name"].tolist())
 
-    tab_master, tab_today, tab_upcoming = st.tabs(
-        ["Define Recurring Tasks", "Today's Checklist", "Upcoming"]
-    )
-
     # ----- Tab 1: define recurring tasks -----
-    with tab_master:
+    def master_tab():
         st.subheader("New recurring task")
 
         title = st.text_input("Task title (e.g. 'Check RO skid drains')")
@@ -1474,24 +3411,27 @@ def page_todo():
         else:
             st.dataframe(df_master)
 
-        if st.button("⚙️ Generate schedule for this operator"):
-            generate_todo_schedule(operator_selected, days_ahead=60)
-            st.success("To-do schedule generated for next 60 days.")
+        col_g1, col_g2 = st.columns(2)
+        with col_g1:
+            if st.button("⚙️ Generate schedule for this operator"):
+                inserted, elapsed = generate_todo_schedule(operator_selected, days_ahead=60)
+                st.success(
+                    f"To-do schedule generated for next 60 days: "
+                    f"{inserted} new items in {elapsed:.2f}s."
+                )
+        with col_g2:
+            if st.button("⚙️ Generate schedule for all operators"):
+                inserted, elapsed = generate_todo_schedule(None, days_ahead=60)
+                st.success(
+                    f"To-do schedules generated for all operators: "
+                    f"{inserted} new items in {elapsed:.2f}s."
+                )
 
     # ----- Tab 2: today's checklist -----
-    with tab_today:
+    def today_tab():
         st.subheader("Checklist")
         date_sel = st.date_input("Checklist date", datetime.date.today())
-        df_items = fetch_df(
-            """
-            SELECT i.id, m.title, i.status
-            FROM operator_todo_items i
-            JOIN operator_todo_master m ON i.master_id = m.id
-            WHERE m.operator_name=%s AND i.due_date=%s
-            ORDER BY i.id
-            """,
-            (operator_selected, date_sel),
-        )
+        df_items = fetch_df(TODO_CHECKLIST_SQL, (operator_selected, date_sel))
 
         if df_items.empty:
             st.info("No to-do items for this date. Generate schedule if needed.")
@@ -1508,7 +3448,7 @@ def page_todo():
                     )
 
     # ----- Tab 3: upcoming -----
-    with tab_upcoming:
+    def upcoming_tab():
         st.subheader("Upcoming Tasks (next 14 days)")
         today = datetime.date.today()
         df_upc = fetch_df(
@@ -1527,6 +3467,405 @@ def page_todo():
         else:
             st.dataframe(df_upc)
 
+    lazy_tabs("todo_tab", {
+        "Define Recurring Tasks": master_tab,
+        "Today's Checklist": today_tab,
+        "Upcoming": upcoming_tab,
+    })
+
+
+# =========================
+# BULK IMPORT (CSV / XLSX)
+# =========================
+
+# Per target: table, columns as (name, kind, required, rule) and the natural
+# key used to upsert. rule is (min, max) for numeric, max length for text and
+# the allowed values for choice columns. NUMERIC(p,2) holds at most 10**(p-2) - 0.01.
+IMPORT_TARGETS = {
+    "Flowmeter readings": {
+        "table": "flowmeter_readings",
+        "columns": [
+            ("reading_date", "date", True, None),
+            ("reading_value", "numeric", True, (0, 9999999999.99)),
+            ("operator", "text", False, 100),
+            ("notes", "text", False, None),
+        ],
+        "key": ["reading_date"],
+    },
+    "Water quality samples": {
+        "table": "water_quality",
+        "columns": [
+            ("sample_date", "date", True, None),
+            ("sample_time", "time", False, None),
+            ("point", "choice", True, SAMPLE_POINTS),
+            ("tds", "numeric", False, (0, 99999999.99)),
+            ("ph", "numeric", False, (0, 14)),
+            ("conductivity", "numeric", False, (0, 99999999.99)),
+            ("turbidity", "numeric", False, (0, 99999999.99)),
+            ("operator", "text", False, 100),
+            ("notes", "text", False, None),
+        ],
+        "key": ["sample_date", "sample_time", "point"],
+    },
+    "Cartridge filter readings": {
+        "table": "cartridge_filters",
+        "columns": [
+            ("entry_date", "date", True, None),
+            ("pressure_before", "numeric", True, (0, 9999.99)),
+            ("pressure_after", "numeric", True, (0, 9999.99)),
+            ("operator", "text", False, 100),
+            ("notes", "text", False, None),
+        ],
+        # Pressures are measurements, not an identity: like chemical movements,
+        # every row is a new reading and look-alikes only raise a warning
+        "key": None,
+        "similar": ["entry_date", "pressure_before", "pressure_after"],
+    },
+    "Chemical movements": {
+        "table": "chemicals_movement",
+        "columns": [
+            ("movement_date", "date", True, None),
+            ("chemical", "choice", True, CHEMICALS),
+            ("qty_in", "numeric", False, (0, 9999999999.99)),
+            ("qty_out", "numeric", False, (0, 9999999999.99)),
+            ("unit_cost", "numeric", False, (0, 9999999999.99)),
+            ("operator", "text", False, 100),
+            ("notes", "text", False, None),
+        ],
+        # Two identical dosings on one day are both real: insert every row and
+        # only warn about rows that look like ones already recorded
+        "key": None,
+        "similar": ["movement_date", "chemical", "qty_in", "qty_out"],
+    },
+}
+
+
+def read_import_file(name, data):
+    """Load an uploaded CSV / XLSX as raw values with normalised column names."""
+    if name.lower().endswith((".xlsx", ".xlsm")):
+        raw = pd.read_excel(BytesIO(data), dtype=object)
+    else:
+        raw = pd.read_csv(BytesIO(data), dtype=str, skipinitialspace=True)
+    raw.columns = (
+        raw.columns.astype(str).str.strip().str.lower()
+        .str.replace(r"[^a-z0-9]+", "_", regex=True).str.strip("_")
+    )
+    return raw
+
+
+# Tried in order after ISO dates; paper logs are written day first (31/01/2025)
+IMPORT_DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y"]
+
+
+def _parse_dates(s):
+    parsed = pd.to_datetime(s, format="ISO8601", errors="coerce")
+    for fmt in IMPORT_DATE_FORMATS:
+        retry = s.notna() & parsed.isna()
+        if not retry.any():
+            break
+        parsed[retry] = pd.to_datetime(s[retry].astype(str), format=fmt, errors="coerce")
+    return parsed.dt.normalize()
+
+
+def _parse_times(s):
+    """Valid times as HH:MM:SS text, NA where the value is not a time."""
+    text = s.astype("string").str.strip()
+    parsed = pd.to_datetime(text, format="%H:%M:%S", errors="coerce").fillna(
+        pd.to_datetime(text, format="%H:%M", errors="coerce")
+    )
+    # Zero-padded, so "8:00" and "08:00" match as duplicates and read back as ISO times
+    return parsed.dt.strftime("%H:%M:%S").astype("string").where(parsed.notna())
+
+
+def validate_import(target, raw):
+    """Validate raw rows for an import target column by column.
+
+    Returns (rows ready to stage, rejected rows). Rejected rows keep the
+    uploaded values plus the spreadsheet ``row`` number and a ``reason``.
+    Raises ValueError when required columns are missing altogether.
+    """
+    spec = IMPORT_TARGETS[target]
+    missing = [name for name, _, required, _ in spec["columns"]
+               if required and name not in raw.columns]
+    if missing:
+        raise ValueError("Missing required column(s): " + ", ".join(missing))
+
+    clean = pd.DataFrame(index=raw.index)
+    checks = []
+    for name, kind, required, rule in spec["columns"]:
+        s = raw[name] if name in raw.columns else pd.Series(np.nan, index=raw.index, dtype=object)
+        present = s.notna()
+        if kind == "date":
+            value = _parse_dates(s)
+            checks.append((present & value.isna(), f"{name}: not a date"))
+        elif kind == "time":
+            value = _parse_times(s)
+            checks.append((present & value.isna(), f"{name}: not a time (HH:MM)"))
+        elif kind == "numeric":
+            value = pd.to_numeric(s, errors="coerce")
+            checks.append((present & value.isna(), f"{name}: not a number"))
+            low, high = rule
+            checks.append(((value < low) | (value > high), f"{name}: outside {low}–{high}"))
+        elif kind == "choice":
+            lookup = {choice.lower(): choice for choice in rule}
+            value = s.astype("string").str.strip().str.lower().map(lookup)
+            checks.append((present & value.isna(), f"{name}: expected one of {', '.join(rule)}"))
+        else:
+            value = s.astype("string").str.strip()
+            if rule is not None:
+                checks.append((value.str.len() > rule, f"{name}: longer than {rule} characters"))
+        if required:
+            checks.append((~present, f"{name}: missing"))
+        clean[name] = value
+
+    table = spec["table"]
+    if table == "cartridge_filters":
+        clean["diff_pressure"] = (clean["pressure_after"] - clean["pressure_before"]).clip(lower=0)
+        clean["status"] = np.select(
+            [clean["diff_pressure"] < 1, clean["diff_pressure"] < 2],
+            ["OK", "Warning"],
+            "Alarm",
+        )
+    elif table == "chemicals_movement":
+        moved = clean["qty_in"].fillna(0) + clean["qty_out"].fillna(0)
+        checks.append((moved <= 0, "qty_in / qty_out: no quantity moved"))
+
+    reason = pd.Series("", index=raw.index, dtype=object)
+    for mask, message in checks:
+        mask = mask.fillna(False).to_numpy(dtype=bool)
+        reason[mask] = reason[mask] + message + "; "
+    bad = reason != ""
+    if spec["key"]:
+        # Several rows for one key would overwrite each other: keep the last one
+        dup = ~bad & clean[~bad].duplicated(spec["key"], keep="last").reindex(raw.index, fill_value=False)
+        reason[dup] = "duplicate of a later row in the file; "
+        bad = bad | dup
+
+    # Optional columns left out of the file must not blank existing values on
+    # update; key columns stay (as NULL) so rows can still be matched
+    absent = [name for name, _, required, _ in spec["columns"]
+              if not required and name not in raw.columns and name not in (spec["key"] or [])]
+    clean = clean.drop(columns=absent)
+
+    rejected = raw[bad].copy()
+    rejected.insert(0, "row", rejected.index + 2)
+    rejected["reason"] = reason[bad].str.rstrip("; ")
+    return clean[~bad].reset_index(drop=True), rejected.reset_index(drop=True)
+
+
+def similar_rows(target, rows):
+    """Count rows of an insert-only import that repeat a row in the file or table.
+
+    Compares on the target's ``similar`` columns within the uploaded date
+    range; absent optional columns compare as NULL, as they will be stored.
+    """
+    spec = IMPORT_TARGETS[target]
+    cols = spec["similar"]
+    date_col = cols[0]
+    upload = rows.reindex(columns=cols)
+    existing = fetch_df(
+        f"SELECT {', '.join(cols)} FROM {spec['table']} WHERE {date_col} BETWEEN %s AND %s",
+        (upload[date_col].min().date(), upload[date_col].max().date()),
+    )
+    for frame in (upload, existing):
+        frame[date_col] = pd.to_datetime(frame[date_col])
+        for name, kind, _, _ in spec["columns"]:
+            if name in cols and kind == "numeric":
+                frame[name] = pd.to_numeric(frame[name], errors="coerce").astype(float)
+    in_file = int(upload.duplicated(keep="first").sum())
+    in_table = len(upload.merge(existing.drop_duplicates(), on=cols, how="inner"))
+    return in_file, in_table
+
+
+def _key_match(spec, left, right):
+    """Join condition on the natural key; NULL matches NULL in optional columns.
+
+    Required columns use plain equality so the planner can hash-join the
+    staging table against the target.
+    """
+    required = {name for name, _, req, _ in spec["columns"] if req}
+    return " AND ".join(
+        f"{left}.{k} = {right}.{k}" if k in required else f"{left}.{k} IS NOT DISTINCT FROM {right}.{k}"
+        for k in spec["key"]
+    )
+
+
+def import_rows(target, rows: pd.DataFrame):
+    """Upsert validated rows into the target table in one transaction.
+
+    Rows are streamed into a temporary staging table with COPY, then
+    existing rows with the same natural key are updated (only the columns
+    the file supplied) and the rest inserted; targets without a key insert
+    every row. Flowmeter imports refresh daily_production from the earliest
+    imported date; chemical imports re-run the balances from the earliest
+    imported date per chemical and update chemicals_stock.
+    Returns (inserted, updated, seconds).
+    """
+    spec = IMPORT_TARGETS[target]
+    table = spec["table"]
+    if table == "chemicals_movement" and "unit_cost" not in rows.columns:
+        rows = rows.assign(unit_cost=np.nan)  # filled from chemicals_stock below
+    cols = list(rows.columns)
+    col_list = ", ".join(cols)
+    key = spec["key"] or []
+    assignments = ", ".join(f"{c}=s.{c}" for c in cols if c not in key)
+    started = time.perf_counter()
+
+    def work(conn):
+        buf = BytesIO(rows.to_csv(index=False, header=False, date_format="%Y-%m-%d").encode())
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # Readers carry on; a second import into the same table waits its turn
+            cur.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute(
+                f"CREATE TEMP TABLE import_stage ON COMMIT DROP AS "
+                f"SELECT {col_list} FROM {table} WITH NO DATA"
+            )
+            cur.copy_expert(f"COPY import_stage ({col_list}) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute("ANALYZE import_stage")
+            if table == "chemicals_movement":
+                cur.execute(
+                    "UPDATE import_stage AS s SET unit_cost = cs.unit_cost FROM chemicals_stock cs "
+                    "WHERE s.unit_cost IS NULL AND cs.chemical = s.chemical"
+                )
+            if key:
+                updated = 0
+                if assignments:  # a file of key columns only has nothing to update
+                    cur.execute(
+                        f"UPDATE {table} AS t SET {assignments} FROM import_stage s "
+                        f"WHERE {_key_match(spec, 't', 's')}"
+                    )
+                    updated = cur.rowcount
+                cur.execute(
+                    f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM import_stage s "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {_key_match(spec, 't', 's')})"
+                )
+            else:
+                updated = 0
+                cur.execute(f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM import_stage")
+            inserted = cur.rowcount
+
+            if table == "flowmeter_readings":
+                _refresh_daily_production(cur, rows["reading_date"].min().date())
+            elif table == "chemicals_movement":
+                _rebalance_chemicals(cur, rows.groupby("chemical")["movement_date"].min())
+        conn.commit()
+        return inserted, updated
+
+    try:
+        inserted, updated = with_connection(work)
+    finally:
+        invalidate_tables(table, "daily_production", "chemicals_stock")
+    return inserted, updated, time.perf_counter() - started
+
+
+def _rebalance_chemicals(cur, start_dates):
+    """Re-run balances from each chemical's start date and refresh chemicals_stock."""
+    for chemical, start in start_dates.items():
+        cur.execute(
+            """
+            WITH base AS (
+                SELECT balance FROM chemicals_movement
+                WHERE chemical = %(chemical)s AND movement_date < %(start)s
+                ORDER BY movement_date DESC, id DESC
+                LIMIT 1
+            ),
+            running AS (
+                SELECT id,
+                       COALESCE((SELECT balance FROM base), 0)
+                       + SUM(COALESCE(qty_in, 0) - COALESCE(qty_out, 0))
+                         OVER (ORDER BY movement_date, id) AS balance
+                FROM chemicals_movement
+                WHERE chemical = %(chemical)s AND movement_date >= %(start)s
+            )
+            UPDATE chemicals_movement AS m
+            SET balance = r.balance, stock_value = r.balance * COALESCE(m.unit_cost, 0)
+            FROM running r
+            WHERE m.id = r.id
+            """,
+            {"chemical": chemical, "start": start.date()},
+        )
+    chemicals = list(start_dates.index)
+    cur.execute(
+        f"""
+        INSERT INTO chemicals_stock (chemical, stock_qty, unit_cost, stock_value)
+        SELECT chemical, balance, unit_cost, stock_value
+        FROM (
+            SELECT chemical, balance, unit_cost, stock_value,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY chemical ORDER BY movement_date DESC, id DESC
+                   ) AS rn
+            FROM chemicals_movement
+            WHERE chemical IN ({", ".join(["%s"] * len(chemicals))})
+        ) latest
+        WHERE rn = 1
+        ON CONFLICT (chemical)
+        DO UPDATE SET stock_qty=EXCLUDED.stock_qty,
+                      unit_cost=EXCLUDED.unit_cost,
+                      stock_value=EXCLUDED.stock_value;
+        """,
+        chemicals,
+    )
+
+
+def page_import():
+    apply_theme()
+    st.markdown("<div class='top-title'>Bulk Import</div>", unsafe_allow_html=True)
+    st.markdown(
+        "<div class='subtitle'>Back-fill readings from a CSV or Excel sheet – one row per entry.</div>",
+        unsafe_allow_html=True,
+    )
+
+    target = st.selectbox("Import into", list(IMPORT_TARGETS))
+    spec = IMPORT_TARGETS[target]
+    st.caption(
+        "Columns: "
+        + ", ".join(f"**{name}**" if required else name
+                    for name, _, required, _ in spec["columns"])
+        + " (bold = required). "
+        + ("Rows matching an existing " + " + ".join(spec["key"]) + " are updated."
+           if spec["key"] else "Every row is inserted as a new entry.")
+    )
+
+    upload = st.file_uploader("CSV or XLSX file", type=["csv", "xlsx"])
+    if upload is None:
+        return
+
+    try:
+        raw = read_import_file(upload.name, upload.getvalue())
+        rows, rejected = validate_import(target, raw)
+    except ValueError as exc:
+        st.error(str(exc))
+        return
+
+    col1, col2 = st.columns(2)
+    col1.metric("Valid rows", f"{len(rows):,}")
+    col2.metric("Rejected rows", f"{len(rejected):,}")
+
+    if not rejected.empty:
+        st.warning("Rejected rows are skipped. Fix them in the file and import it again.")
+        st.dataframe(rejected.head(200))
+        st.download_button(
+            "⬇️ Download rejection report (CSV)",
+            data=rejected.to_csv(index=False).encode(),
+            file_name=f"{spec['table']}_rejected.csv",
+            mime="text/csv",
+        )
+
+    if rows.empty:
+        return
+    if not spec["key"]:
+        in_file, in_table = similar_rows(target, rows)
+        if in_file or in_table:
+            st.warning(
+                f"{in_file:,} rows repeat an earlier row in the file and {in_table:,} match an "
+                f"entry already recorded ({', '.join(spec['similar'])}). They will all be "
+                "inserted – remove them from the file first if they are not separate entries."
+            )
+    if st.button(f"⬆️ Import {len(rows):,} rows into {spec['table']}"):
+        with st.spinner("Importing..."):
+            inserted, updated, seconds = import_rows(target, rows)
+        st.success(f"{inserted:,} rows inserted, {updated:,} updated in {seconds:.1f}s.")
+
 
 # =========================
 # OPERATION MANUAL PAGE
@@ -1610,56 +3949,108 @@ def page_operation_manual():
         )
 
 
+# =========================
+# DEVELOPER PANEL
+# =========================
+
+def dev_panel_enabled():
+    # The panel shows SQL and pool internals: only where the deployment allows it
+    return DEV_PANEL and st.query_params.get("dev") == "1"
+
+
+def render_dev_panel(log: QueryLog, profile: PageProfile = None):
+    """Sidebar breakdown of this render's statements, slow queries and pool / cache use.
+
+    With a profiled render it also shows the phase breakdown and how this
+    page compares with earlier releases.
+    """
+    with st.sidebar.expander("🛠 Developer: data layer", expanded=False):
+        totals = log.totals()
+        st.caption(
+            f"This render: {totals['statements']} statements, {totals['ms']:.1f} ms in the "
+            f"database, {totals['rows']:,} rows, ~{totals['bytes'] / 1024:,.0f} kB fetched, "
+            f"{totals['cache_hits']} reads served from the query cache"
+        )
+        for shape, count, site in log.repeated():
+            st.warning(f"Possible N+1: {count}× from {site or 'unknown caller'} – {shape[:160]}")
+        by_shape = log.by_shape()
+        if not by_shape.empty:
+            st.dataframe(by_shape, hide_index=True)
+
+        st.caption(f"Slow queries (≥ {SLOW_QUERY_MS:g} ms, latest first)")
+        if SLOW_QUERY_LOG:
+            slow = pd.DataFrame(
+                [
+                    (s.slow_at.strftime("%Y-%m-%d %H:%M:%S"), s.page,
+                     round(s.seconds * 1000, 1), s.rows, s.shape)
+                    for s in reversed(SLOW_QUERY_LOG)
+                ],
+                columns=["at", "page", "ms", "rows", "statement"],
+            )
+            st.dataframe(slow, hide_index=True)
+        else:
+            st.write("None recorded.")
+
+        st.caption("Connection pool")
+        st.json(get_pool().metrics())
+        st.caption("Query cache")
+        st.json(get_query_cache().stats())
+
+    if profile is None:
+        return
+    with st.sidebar.expander("⏱ Profile of this render", expanded=False):
+        rec = profile.record(log)
+        peak = f", peak memory {rec['peak_kb']:,.0f} kB" if rec["peak_kb"] is not None else ""
+        st.caption(f"{rec['total_ms']:,.1f} ms in {rec['page']} ({rec['release']}){peak}")
+        st.dataframe(
+            pd.DataFrame(list(rec["phases_ms"].items()), columns=["phase", "ms"]),
+            hide_index=True,
+        )
+        if rec["samples"]:
+            st.caption(f"Stack samples ({rec['samples']} every {PROFILE_INTERVAL_MS:g} ms)")
+            st.json({"functions": rec["functions"], "libraries": rec["libraries"]})
+        history = load_profiles()
+        if not history.empty:
+            st.caption("This page across releases")
+            st.dataframe(compare_profiles(history, profile.page), hide_index=True)
+
+
 # =========================
 # MAIN ENTRY POINT
 # =========================
 
+# Navigation label -> page function, in sidebar order
+PAGES = {
+    "Dashboard": page_dashboard,
+    "Flowmeter Readings": page_flowmeter,
+    "Production Reports": page_production,
+    "Chemical Movement": page_chemicals,
+    "Cartridge Filters": page_filters,
+    "Water Quality": page_water_quality,
+    "System Status": page_system_status,
+    "Maintenance Log": page_maintenance_log,
+    "Maintenance CMMS": page_cmms,
+    "To-Do List": page_todo,
+    "Bulk Import": page_import,
+    "Operation Manual": page_operation_manual,
+}
+
+
 def main():
     st.set_page_config(page_title="Um Qasr RO System", layout="wide", page_icon="💧")
     apply_theme()
-    init_db()
-    seed_maintenance_master()
+    ensure_schema()
 
     st.sidebar.title("Um Qasr RO System – Emerald Unit")
-    page = st.sidebar.radio(
-        "Navigate",
-        [
-            "Dashboard",
-            "Flowmeter Readings",
-            "Production Reports",
-            "Chemical Movement",
-            "Cartridge Filters",
-            "Water Quality",
-            "System Status",
-            "Maintenance Log",
-            "Maintenance CMMS",
-            "To-Do List",
-            "Operation Manual",
-        ],
-    )
-
-    if page == "Dashboard":
-        page_dashboard()
-    elif page == "Flowmeter Readings":
-        page_flowmeter()
-    elif page == "Production Reports":
-        page_production()
-    elif page == "Chemical Movement":
-        page_chemicals()
-    elif page == "Cartridge Filters":
-        page_filters()
-    elif page == "Water Quality":
-        page_water_quality()
-    elif page == "System Status":
-        page_system_status()
-    elif page == "Maintenance Log":
-        page_maintenance_log()
-    elif page == "Maintenance CMMS":
-        page_cmms()
-    elif page == "To-Do List":
-        page_todo()
-    elif page == "Operation Manual":
-        page_operation_manual()
+    page = st.sidebar.radio("Navigate", list(PAGES))
+
+    profile = PageProfile(page) if profiling_requested() else None
+    with QueryLog(page) as log, rerun_memo(), (profile or contextlib.nullcontext()):
+        PAGES[page]()
+    if profile is not None:
+        save_profile(profile.record(log))
+    if dev_panel_enabled():
+        render_dev_panel(log, profile)
 
 
 if __name__ == "__main__":
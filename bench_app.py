@@ -0,0 +1,548 @@
+"""Benchmark every page of app.py and its batch jobs on synthetic plant data.
+
+A deterministic generator fills every table created by app.init_db with
+N years of plausible readings up to --end-date (default yesterday):
+daily flowmeter readings, hourly water quality at Feed/Permeate/Reject,
+filter pressures, chemical deliveries and consumption, system status,
+maintenance history, a year of CMMS work orders and operator checklists.
+The same seed and end date always produce the same rows.
+
+Each page function is then rendered through Streamlit's headless AppTest,
+once with cold caches and --repeat times warm, and generate_cmms_schedule,
+generate_todo_schedule and the daily production recalculation are timed
+directly. Page timings include Streamlit's own per-run cost, which is
+measured with an empty script and reported as apptest_overhead. Results
+are written as JSON; --compare flags timings that got slower than a
+previous result file.
+
+    python bench_app.py --sqlite /tmp/bench.db --years 3
+    python bench_app.py --db-url postgresql://localhost/ro_bench --reset -o after.json
+    python bench_app.py --sqlite /tmp/bench.db --compare before.json
+
+The target database is written to; never point it at the production one.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from streamlit.testing.v1 import AppTest
+
+import app
+
+YEARS = 2
+SEED = 42
+REPEAT = 3
+COMPARE_THRESHOLD = 1.2   # --compare flags timings this many times slower...
+COMPARE_MIN_MS = 5.0      # ...and at least this many ms slower, to ignore noise
+
+OPERATORS = ["Ahmed", "Hassan", "Karim", "Mustafa"]
+COMPONENTS = ["HP pump", "LP pump", "Feed pump", "Cartridge housing", "RO membranes",
+              "Dosing pump", "UV sterilizer", "Control panel"]
+
+# Tables the generator fills, children before parents so they can be emptied in order
+BENCH_TABLES = [
+    "operator_todo_items", "operator_todo_master", "maintenance_workorders",
+    "maintenance_master", "daily_production", "flowmeter_readings", "water_quality",
+    "cartridge_filters", "chemicals_movement", "chemicals_stock", "system_status",
+    "maintenance_log", "operators",
+]
+
+# Page render script; the page runs exactly as main() would call it
+PAGE_SCRIPT = """
+import app
+app.ensure_schema()
+app.PAGES[{label!r}]()
+"""
+# Same script without the page, to measure what AppTest itself costs per run
+EMPTY_SCRIPT = """
+import app
+app.ensure_schema()
+"""
+
+
+# -------------------------------------------------
+#  Synthetic data
+# -------------------------------------------------
+def day_range(end_date, years):
+    days = int(round(years * 365))
+    return pd.date_range(end=end_date, periods=days, freq="D").date
+
+
+def gen_flowmeter(rng, dates):
+    """Totaliser readings: ~1200 m³/day with the odd missed day."""
+    produced = np.clip(rng.normal(1200, 150, len(dates)), 0, None)
+    totals = np.round(100000 + np.cumsum(produced), 2)
+    kept = rng.random(len(dates)) > 0.02
+    kept[[0, -1]] = True
+    operators = rng.choice(OPERATORS, len(dates))
+    return [
+        (d, float(v), op, None)
+        for d, v, op, keep in zip(dates, totals, operators, kept) if keep
+    ]
+
+
+def gen_water_quality(rng, dates):
+    """One sample per hour at each point."""
+    profiles = {  # point: (tds mean, tds sd, ph mean)
+        "Feed": (38000, 1500, 7.9),
+        "Permeate": (250, 40, 6.8),
+        "Reject": (62000, 2500, 7.6),
+    }
+    hours = [datetime.time(h) for h in range(24)]
+    n = len(dates) * len(hours)
+    rows = []
+    for point, (tds_mean, tds_sd, ph_mean) in profiles.items():
+        tds = np.round(np.clip(rng.normal(tds_mean, tds_sd, n), 1, None), 2)
+        ph = np.round(rng.normal(ph_mean, 0.15, n), 2)
+        cond = np.round(tds * 1.56, 2)
+        turb = np.round(np.abs(rng.normal(0.3, 0.1, n)), 2)
+        operators = rng.choice(OPERATORS, n)
+        for i, (d, t) in enumerate((d, t) for d in dates for t in hours):
+            rows.append((d, t, point, float(tds[i]), float(ph[i]), float(cond[i]),
+                         float(turb[i]), operators[i], None))
+    rows.sort(key=lambda r: (r[0], r[1]))
+    return rows
+
+
+def gen_cartridge(rng, dates):
+    """Daily ΔP creeping up over a ~90 day filter life, then reset."""
+    rows = []
+    for i, d in enumerate(dates):
+        before = round(float(rng.normal(3.5, 0.1)), 2)
+        diff = round(0.3 + (i % 90) * 0.025 + float(abs(rng.normal(0, 0.05))), 2)
+        status = "OK" if diff < 1 else "Warning" if diff < 2 else "Alarm"
+        rows.append((d, before, round(before + diff, 2), diff, status,
+                     str(rng.choice(OPERATORS)), None))
+    return rows
+
+
+def gen_chemicals(rng, dates):
+    """Daily dosing with a delivery every two weeks; returns (movements, stock)."""
+    usage = {"HCL": (40, 8, 1.2), "BC": (5, 1, 6.5), "Chlorine": (12, 3, 2.1)}
+    movements, stock = [], []
+    for chemical, (per_day, sd, unit_cost) in usage.items():
+        balance = per_day * 30.0
+        for i, d in enumerate(dates):
+            qty_in = round(per_day * 14.0, 2) if i % 14 == 0 else 0.0
+            qty_out = round(min(max(float(rng.normal(per_day, sd)), 0.0), balance + qty_in), 2)
+            balance = round(balance + qty_in - qty_out, 2)
+            movements.append((d, chemical, qty_in, qty_out, balance,
+                              str(rng.choice(OPERATORS)), None,
+                              unit_cost, round(balance * unit_cost, 2)))
+        stock.append((chemical, balance, unit_cost, round(balance * unit_cost, 2)))
+    movements.sort(key=lambda r: r[0])
+    return movements, stock
+
+
+def gen_system_status(rng, end_date, days):
+    """A pump snapshot every six hours."""
+    start = datetime.datetime.combine(end_date - datetime.timedelta(days=days - 1), datetime.time())
+    rows = []
+    for k in range(days * 4):
+        ro = bool(rng.random() > 0.05)
+        rows.append((start + datetime.timedelta(hours=6 * k),
+                     ro, ro or bool(rng.random() > 0.5), ro, ro))
+    return rows
+
+
+def gen_maintenance_log(rng, dates):
+    """About two log entries a week."""
+    return [
+        (d, str(rng.choice(COMPONENTS)), "Inspected and serviced",
+         str(rng.choice(OPERATORS)), None)
+        for d in dates if rng.random() < 2 / 7
+    ]
+
+
+def gen_workorders(rng, masters, end_date):
+    """The last year of CMMS work orders, mostly completed on time."""
+    rows = []
+    start = end_date - datetime.timedelta(days=365)
+    for m in masters:
+        for due in app.recurrence_dates(start, end_date, int(m["interval_days"])):
+            done = (end_date - due).days > 7 and rng.random() < 0.9
+            if done:
+                finished = due + datetime.timedelta(days=int(rng.integers(0, 4)))
+                rows.append((m["id"], due, "Completed", "Medium", str(rng.choice(OPERATORS)),
+                             2.0, round(float(rng.uniform(1, 4)), 2),
+                             round(float(rng.uniform(20, 400)), 2), min(finished, end_date), None))
+            else:
+                rows.append((m["id"], due, "Pending", "Medium", None, 2.0, None, None, None, None))
+    return rows
+
+
+def gen_todo(rng, end_date):
+    """Three recurring tasks per operator and their last 60 days of checklist items."""
+    masters = [
+        (op, title, freq, interval, True)
+        for op in OPERATORS
+        for title, freq, interval in [
+            ("Check RO skid drains", "Daily", 1),
+            ("Clean dosing tank strainers", "Weekly", 7),
+            ("Calibrate pH probe", "Monthly", 30),
+        ]
+    ]
+    start = end_date - datetime.timedelta(days=59)
+
+    def items(master_ids):
+        return [
+            (mid, d, "Completed" if rng.random() < 0.85 else "Pending")
+            for mid, (_, _, _, interval, _) in zip(master_ids, masters)
+            for d in app.recurrence_dates(start, end_date, interval)
+        ]
+
+    return masters, items
+
+
+def table_counts():
+    return {
+        t: int(app.run_query(f"SELECT COUNT(*) AS c FROM {t}", fetch=True)[0]["c"])
+        for t in BENCH_TABLES
+    }
+
+
+def reset_tables():
+    def work(conn):
+        with conn.cursor() as cur:
+            for table in BENCH_TABLES:
+                cur.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+    app.with_connection(work)
+    app.get_query_cache().clear()
+
+
+def generate_dataset(years, seed, end_date):
+    """Fill every app table with ``years`` of synthetic data; return seconds taken."""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    dates = day_range(end_date, years)
+
+    app.run_batch("INSERT INTO operators (name, role) VALUES %s",
+                  [(op, "Operator") for op in OPERATORS])
+    app.run_batch(
+        "INSERT INTO flowmeter_readings (reading_date, reading_value, operator, notes) VALUES %s",
+        gen_flowmeter(rng, dates),
+    )
+    app.rebuild_daily_production()
+    app.run_batch(
+        """
+        INSERT INTO water_quality
+        (sample_date, sample_time, point, tds, ph, conductivity, turbidity, operator, notes)
+        VALUES %s
+        """,
+        gen_water_quality(rng, dates),
+    )
+    app.run_batch(
+        """
+        INSERT INTO cartridge_filters
+        (entry_date, pressure_before, pressure_after, diff_pressure, status, operator, notes)
+        VALUES %s
+        """,
+        gen_cartridge(rng, dates),
+    )
+    movements, stock = gen_chemicals(rng, dates)
+    app.run_batch(
+        """
+        INSERT INTO chemicals_movement
+        (movement_date, chemical, qty_in, qty_out, balance, operator, notes, unit_cost, stock_value)
+        VALUES %s
+        """,
+        movements,
+    )
+    app.run_batch(
+        "INSERT INTO chemicals_stock (chemical, stock_qty, unit_cost, stock_value) VALUES %s",
+        stock,
+    )
+    app.run_batch(
+        "INSERT INTO system_status (status_time, hp_pump, lp_pump, feed_pump, ro_running) VALUES %s",
+        gen_system_status(rng, end_date, len(dates)),
+    )
+    app.run_batch(
+        "INSERT INTO maintenance_log (maint_date, component, action, operator, notes) VALUES %s",
+        gen_maintenance_log(rng, dates),
+    )
+
+    app.seed_maintenance_master()
+    masters = app.run_query(
+        "SELECT id, interval_days FROM maintenance_master ORDER BY id", fetch=True
+    )
+    app.run_batch(
+        """
+        INSERT INTO maintenance_workorders
+        (master_id, due_date, status, priority, technician, estimated_hours,
+         actual_hours, cost, completion_date, remarks)
+        VALUES %s
+        """,
+        gen_workorders(rng, masters, end_date),
+    )
+
+    todo_masters, todo_items = gen_todo(rng, end_date)
+    app.run_batch(
+        """
+        INSERT INTO operator_todo_master (operator_name, title, frequency, interval_days, active)
+        VALUES %s
+        """,
+        todo_masters,
+    )
+    master_ids = [
+        r["id"] for r in app.run_query("SELECT id FROM operator_todo_master ORDER BY id", fetch=True)
+    ]
+    app.run_batch(
+        "INSERT INTO operator_todo_items (master_id, due_date, status) VALUES %s",
+        todo_items(master_ids),
+    )
+    return time.perf_counter() - started
+
+
+# -------------------------------------------------
+#  Timing
+# -------------------------------------------------
+def clear_caches():
+    app.get_query_cache().clear()
+    app.get_export_cache().clear()
+
+
+def render_page(label=None):
+    """Render one page headlessly; return (milliseconds, first exception or None).
+
+    Without a label only the harness runs, which gives the fixed overhead
+    included in every page timing.
+    """
+    script = EMPTY_SCRIPT if label is None else PAGE_SCRIPT.format(label=label)
+    at = AppTest.from_string(script, default_timeout=300)
+    started = time.perf_counter()
+    at.run()
+    elapsed = (time.perf_counter() - started) * 1000
+    errors = [e.value for e in at.exception]
+    return elapsed, errors[0] if errors else None
+
+
+def summarize(runs_ms):
+    return {
+        "median_ms": round(statistics.median(runs_ms), 2),
+        "min_ms": round(min(runs_ms), 2),
+        "max_ms": round(max(runs_ms), 2),
+        "runs_ms": [round(r, 2) for r in runs_ms],
+    }
+
+
+def bench_overhead(repeat):
+    render_page()  # warm up imports and ensure_schema outside any timing
+    return summarize([render_page()[0] for _ in range(max(repeat, 3))])
+
+
+def bench_pages(labels, repeat):
+    results = {}
+    for label in labels:
+        clear_caches()
+        cold_ms, error = render_page(label)
+        warm = [render_page(label) for _ in range(repeat)]
+        error = error or next((e for _, e in warm if e), None)
+        results[label] = {
+            "function": app.PAGES[label].__name__,
+            "cold_ms": round(cold_ms, 2),
+            **summarize([ms for ms, _ in warm]),
+        }
+        if error:
+            results[label]["error"] = error
+        print(f"  {label:<20} cold {cold_ms:8.1f} ms   warm {results[label]['median_ms']:8.1f} ms"
+              + (f"   ERROR: {error}" if error else ""), file=sys.stderr)
+    return results
+
+
+def drop_scheduled_from(today):
+    """Remove work orders / to-do items the job benchmarks created, restoring the dataset."""
+    app.run_query("DELETE FROM maintenance_workorders WHERE due_date >= %s", (today,))
+    app.run_query("DELETE FROM operator_todo_items WHERE due_date >= %s", (today,))
+
+
+def time_job(fn, repeat, setup=None):
+    """Time ``fn`` ``repeat`` times; fn returns the rows it touched."""
+    runs, rows = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        rows = fn()
+        runs.append((time.perf_counter() - started) * 1000)
+    return {**summarize(runs), "rows": rows}
+
+
+def bench_jobs(repeat):
+    today = datetime.date.today()
+    latest = app.run_query(
+        "SELECT reading_date, reading_value FROM flowmeter_readings ORDER BY reading_date DESC LIMIT 1",
+        fetch=True,
+    )[0]
+    year_back = app.run_query(
+        "SELECT reading_date, reading_value FROM flowmeter_readings "
+        "WHERE reading_date <= %s ORDER BY reading_date DESC LIMIT 1",
+        (latest["reading_date"] - datetime.timedelta(days=365),),
+        fetch=True,
+    )
+
+    def reset():
+        drop_scheduled_from(today)
+
+    def resave(reading):
+        return lambda: app.save_flowmeter_reading(
+            reading["reading_date"], reading["reading_value"]
+        ) or 1
+
+    jobs = {
+        "generate_cmms_schedule": time_job(
+            lambda: app.generate_cmms_schedule(today, 365)[0], repeat, reset),
+        "generate_cmms_schedule (rerun)": time_job(
+            lambda: app.generate_cmms_schedule(today, 365)[0], repeat),
+        "generate_todo_schedule": time_job(
+            lambda: app.generate_todo_schedule(None, 60)[0], repeat, reset),
+        "generate_todo_schedule (rerun)": time_job(
+            lambda: app.generate_todo_schedule(None, 60)[0], repeat),
+        "rebuild_daily_production": time_job(app.rebuild_daily_production, repeat),
+        "save_flowmeter_reading (latest)": time_job(resave(latest), repeat),
+    }
+    if year_back:
+        jobs["save_flowmeter_reading (1 year back)"] = time_job(resave(year_back[0]), repeat)
+    reset()
+    for name, result in jobs.items():
+        print(f"  {name:<38} {result['median_ms']:8.1f} ms", file=sys.stderr)
+    return jobs
+
+
+# -------------------------------------------------
+#  Reporting
+# -------------------------------------------------
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline_path, threshold=COMPARE_THRESHOLD, min_ms=COMPARE_MIN_MS):
+    """Print timings that changed against a baseline result; return the regressions."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for section, field in [("pages", "cold_ms"), ("pages", "median_ms"), ("jobs", "median_ms")]:
+        for name, now in result[section].items():
+            before = baseline.get(section, {}).get(name, {}).get(field)
+            if before is None:
+                continue
+            after = now[field]
+            ratio = after / before if before else float("inf")
+            slower = ratio >= threshold and after - before >= min_ms
+            marker = "SLOWER" if slower else "faster" if ratio <= 1 / threshold else ""
+            print(f"  {section}/{name} {field}: {before:.1f} -> {after:.1f} ms "
+                  f"({ratio:.2f}x) {marker}".rstrip(), file=sys.stderr)
+            if slower:
+                regressions.append((section, name, field, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--sqlite", metavar="PATH", help="benchmark an SQLite database file")
+    target.add_argument("--db-url", help="benchmark a (scratch) Postgres database")
+    parser.add_argument("--years", type=float, default=YEARS, help="years of data to generate")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--end-date", type=datetime.date.fromisoformat,
+                        default=datetime.date.today() - datetime.timedelta(days=1),
+                        help="last day of generated data (YYYY-MM-DD, before today)")
+    parser.add_argument("--reset", action="store_true",
+                        help="empty the app tables and regenerate when they already hold data")
+    parser.add_argument("--reuse", action="store_true",
+                        help="benchmark the data already in the database without generating")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="warm runs per page / job")
+    parser.add_argument("--pages", nargs="+", choices=list(app.PAGES), default=list(app.PAGES))
+    parser.add_argument("--skip-jobs", action="store_true", help="time the pages only")
+    parser.add_argument("-o", "--output", help="write the JSON result here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="report timings against an earlier JSON result; exit 1 on regressions")
+    args = parser.parse_args()
+    if args.end_date >= datetime.date.today():
+        parser.error("--end-date must be before today (the job benchmarks schedule from today)")
+
+    if args.sqlite:
+        app.DB_BACKEND, app.SQLITE_PATH = "sqlite", args.sqlite
+        database = args.sqlite
+    else:
+        app.DB_BACKEND, app.DB_URL = "postgres", args.db_url
+        database = psycopg2.extensions.parse_dsn(args.db_url).get("dbname")
+
+    app.init_db()
+    generate_s = None
+    if not args.reuse:
+        if app.run_query("SELECT COUNT(*) AS c FROM flowmeter_readings", fetch=True)[0]["c"]:
+            if not args.reset:
+                sys.exit("The database already holds data: pass --reset to replace it "
+                         "or --reuse to benchmark it as is.")
+            reset_tables()
+        print(f"[1] Generating {args.years:g} years of data up to {args.end_date}...", file=sys.stderr)
+        generate_s = generate_dataset(args.years, args.seed, args.end_date)
+        print(f"    done in {generate_s:.1f}s", file=sys.stderr)
+
+    result = {
+        "meta": {
+            "backend": app.DB_BACKEND,
+            "database": database,
+            "years": args.years,
+            "seed": args.seed,
+            "end_date": args.end_date.isoformat(),
+            "generated": not args.reuse,
+            "repeat": args.repeat,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "rows": table_counts(),
+        "generate_s": round(generate_s, 2) if generate_s is not None else None,
+    }
+    print("[2] Rendering pages...", file=sys.stderr)
+    result["apptest_overhead"] = bench_overhead(args.repeat)
+    print(f"  AppTest overhead per render {result['apptest_overhead']['median_ms']:.1f} ms",
+          file=sys.stderr)
+    result["pages"] = bench_pages(args.pages, args.repeat)
+    result["jobs"] = {}
+    if not args.skip_jobs:
+        print("[3] Timing batch jobs...", file=sys.stderr)
+        result["jobs"] = bench_jobs(args.repeat)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    failed = [label for label, page in result["pages"].items() if "error" in page]
+    if args.compare:
+        print(f"[4] Comparing with {args.compare}...", file=sys.stderr)
+        regressions = compare(result, args.compare)
+        if regressions:
+            print(f"❌ {len(regressions)} timings regressed.", file=sys.stderr)
+            sys.exit(1)
+        print("✅ No regressions.", file=sys.stderr)
+    if failed:
+        print(f"❌ Pages raised errors: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""EXPLAIN the hot page queries of app.py and confirm each one is index-served.
+
+Run it against a database that holds production-sized tables:
+
+    python check_indexes.py
+    python check_indexes.py --db-url postgresql://.../bench
+
+On small tables the planner rightly prefers sequential scans; use
+--force-index there to check that a matching index exists and is usable.
+"""
+
+import argparse
+import datetime
+import sys
+
+import app
+
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan", "Bitmap Heap Scan"}
+
+
+# -------------------------------------------------
+#  Page queries worth an index: (name, tables, sql, params)
+#  Built from app.py's own SQL so the check follows the pages.
+# -------------------------------------------------
+# History views as the pages page them: (view, date column, filter)
+HISTORY_VIEWS = [
+    ("flowmeter_history", "reading_date", "reading_date >= %s"),
+    ("wq_history", "sample_date", "sample_date >= %s"),
+    ("chem_history", "movement_date", "movement_date >= %s"),
+    ("filters_history", "entry_date", "entry_date >= %s"),
+    ("maint_history", "maint_date", "maint_date >= %s"),
+    ("status_history", "status_time", None),
+]
+
+
+def hot_queries():
+    today = datetime.date.today()
+    month_ago = today - datetime.timedelta(days=30)
+    queries = [
+        (
+            # The lifetime total sums all of daily_production (one row per day)
+            # and chemicals_stock holds one row per chemical: both are scanned
+            "dashboard", ("cartridge_filters", "water_quality", "maintenance_workorders"),
+            app.DASHBOARD_SQL,
+            {"month_start": today.replace(day=1), "today": today,
+             "next14": today + datetime.timedelta(days=14)},
+        ),
+        (
+            "production: report range", ("daily_production",),
+            app.PRODUCTION_REPORT_SQL, (month_ago, today),
+        ),
+        (
+            "water quality: permeate trend", ("water_quality",),
+            app.QUALITY_TREND_SQL,
+            {"bucket": 3600, "point": "Permeate", "start": month_ago, "end": today},
+        ),
+        (
+            "chemicals: last movement", ("chemicals_movement",),
+            app.LAST_MOVEMENT_SQL, ("HCL",),
+        ),
+        (
+            "cmms: headline counts", ("maintenance_workorders",),
+            app.CMMS_COUNTS_SQL, app.cmms_params(today),
+        ),
+        (
+            "to-do: checklist items", ("operator_todo_items",),
+            app.TODO_CHECKLIST_SQL, ("Operator", today),
+        ),
+    ]
+    for tab, sql in app.CMMS_LIST_SQL.items():
+        queries.append((f"cmms: {tab} tab", ("maintenance_workorders",), sql, app.cmms_params(today)))
+    for view, date_col, where in HISTORY_VIEWS:
+        table = app.TABLE_VIEWS[view][0]
+        params = (month_ago,) if where else ()
+        cursor = (datetime.datetime.now() if date_col == "status_time" else today, 2 ** 31 - 1)
+        queries.append((
+            f"{view}: next page", (table,),
+            app.history_page_sql(view, date_col, where, after_cursor=True),
+            params + cursor,
+        ))
+    return queries
+
+
+def plan_scans(plan):
+    """Yield (node type, relation, index) for every scan node of a JSON plan."""
+    if "Relation Name" in plan or "Index Name" in plan:
+        yield plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name")
+    for child in plan.get("Plans", []):
+        yield from plan_scans(child)
+
+
+def check_index_usage(force_index=False):
+    """EXPLAIN every hot query; return (name, tables, uses_index, scans) rows."""
+    def work(conn):
+        results = []
+        with conn.cursor() as cur:
+            if force_index:
+                cur.execute("SET LOCAL enable_seqscan = off")
+            for name, tables, sql, params in hot_queries():
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cur.fetchone()[0][0]["Plan"]
+                scans = list(plan_scans(plan))
+                # Bitmap heap scans carry the relation; their index child carries the index name
+                uses_index = True
+                for table in tables:
+                    on_table = [node for node, rel, _ in scans if rel == table]
+                    uses_index &= bool(on_table) and all(node in INDEX_NODES for node in on_table)
+                results.append((name, tables, uses_index, scans))
+        conn.rollback()
+        return results
+
+    return app.with_connection(work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", help="database to check (default: app.DB_URL)")
+    parser.add_argument("--force-index", action="store_true",
+                        help="disable sequential scans to check index usability on small tables")
+    args = parser.parse_args()
+    if args.db_url:
+        app.DB_URL = args.db_url
+        app.DB_BACKEND = "postgres"
+    if app.DB_BACKEND != "postgres":
+        sys.exit("check_indexes reads Postgres plans; unset RO_DB_BACKEND or pass --db-url.")
+
+    app.init_db()
+    failures = 0
+    for name, _, uses_index, scans in check_index_usage(args.force_index):
+        detail = ", ".join(
+            node + (f" on {rel}" if rel else "") + (f" using {idx}" if idx else "")
+            for node, rel, idx in scans
+        )
+        print(f"[{'OK' if uses_index else 'SEQ'}] {name}: {detail}")
+        failures += not uses_index
+
+    if failures:
+        print(f"❌ {failures} page queries are not index-served.")
+        sys.exit(1)
+    print("✅ All page queries use an index.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,276 +1,925 @@
-import sqlite3
-import psycopg2
-from psycopg2.extras import execute_values
-import pandas as pd
-
-# === 1) PATH TO YOUR LOCAL SQLITE DB ===
-SQLITE_DB = r"C:\Users\acer\OneDrive\Nileps\NFM_RO\ro_uaq.db"
-
-# === 2) YOUR NEON CONNECTION URL ===
-NEON_URL = (
-    "postgresql://neondb_owner:"
-    "npg_C4ghxK1yUcfw@"
-    "ep-billowing-fog-agxbr2fc-pooler.c-2.eu-central-1.aws.neon.tech/"
-    "neondb?sslmode=require&channel_binding=require"
-)
-
-# -------------------------------------------------
-#  Create tables in Neon (same schema as new RO app)
-# -------------------------------------------------
-def create_tables_pg(conn):
-    cur = conn.cursor()
-
-    # readings
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS readings (
-            id SERIAL PRIMARY KEY,
-            d DATE,
-            tds DOUBLE PRECISION,
-            ph DOUBLE PRECISION,
-            conductivity DOUBLE PRECISION,
-            flow_m3 DOUBLE PRECISION,
-            production DOUBLE PRECISION,
-            maintenance TEXT,
-            notes TEXT
-        );
-    """)
-
-    # cartridge
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS cartridge (
-            id SERIAL PRIMARY KEY,
-            d DATE,
-            dp DOUBLE PRECISION,
-            remarks TEXT,
-            is_change INTEGER DEFAULT 0,
-            change_cost DOUBLE PRECISION DEFAULT 0
-        );
-    """)
-
-    # chemicals
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS chemicals (
-            name TEXT PRIMARY KEY,
-            qty DOUBLE PRECISION,
-            unit_cost DOUBLE PRECISION DEFAULT 0
-        );
-    """)
-
-    # chemical movements
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS chemical_movements (
-            id SERIAL PRIMARY KEY,
-            d DATE,
-            name TEXT,
-            movement_type TEXT,
-            qty DOUBLE PRECISION,
-            remarks TEXT
-        );
-    """)
-
-    conn.commit()
-    cur.close()
-
-
-# -------------------------------------------------
-#  Helpers to load from SQLite
-# -------------------------------------------------
-def load_sqlite_table(table_name):
-    conn = sqlite3.connect(SQLITE_DB)
-    df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-    conn.close()
-    print(f"[SQLite] Loaded {len(df)} rows from {table_name}")
-    return df
-
-
-# -------------------------------------------------
-#  Migrate each table
-# -------------------------------------------------
-def migrate_readings(pg_conn):
-    df = load_sqlite_table("readings")
-    if df.empty:
-        print("[readings] No data to migrate.")
-        return
-
-    # Some old DBs may not have all columns – fill if missing
-    for col in ["d", "tds", "ph", "conductivity", "flow_m3", "production", "maintenance", "notes"]:
-        if col not in df.columns:
-            df[col] = None
-
-    rows = list(
-        zip(
-            df["d"],
-            df["tds"],
-            df["ph"],
-            df["conductivity"],
-            df["flow_m3"],
-            df["production"],
-            df["maintenance"],
-            df["notes"],
-        )
-    )
-
-    cur = pg_conn.cursor()
-    execute_values(
-        cur,
-        """
-        INSERT INTO readings
-            (d, tds, ph, conductivity, flow_m3, production, maintenance, notes)
-        VALUES %s
-        """,
-        rows,
-    )
-    pg_conn.commit()
-    cur.close()
-    print(f"[readings] Migrated {len(rows)} rows to Neon.")
-
-
-def migrate_cartridge(pg_conn):
-    df = load_sqlite_table("cartridge")
-    if df.empty:
-        print("[cartridge] No data to migrate.")
-        return
-
-    for col in ["d", "dp", "remarks", "is_change", "change_cost"]:
-        if col not in df.columns:
-            df[col] = 0 if col in ["dp", "is_change", "change_cost"] else ""
-
-    rows = list(
-        zip(
-            df["d"],
-            df["dp"],
-            df["remarks"],
-            df["is_change"],
-            df["change_cost"],
-        )
-    )
-
-    cur = pg_conn.cursor()
-    execute_values(
-        cur,
-        """
-        INSERT INTO cartridge
-            (d, dp, remarks, is_change, change_cost)
-        VALUES %s
-        """,
-        rows,
-    )
-    pg_conn.commit()
-    cur.close()
-    print(f"[cartridge] Migrated {len(rows)} rows to Neon.")
-
-
-def migrate_chemicals(pg_conn):
-    df = load_sqlite_table("chemicals")
-    if df.empty:
-        print("[chemicals] No data to migrate.")
-        return
-
-    for col in ["name", "qty", "unit_cost"]:
-        if col not in df.columns:
-            if col == "name":
-                df[col] = ""
-            else:
-                df[col] = 0.0
-
-    rows = list(
-        zip(
-            df["name"],
-            df["qty"],
-            df["unit_cost"],
-        )
-    )
-
-    cur = pg_conn.cursor()
-    execute_values(
-        cur,
-        """
-        INSERT INTO chemicals
-            (name, qty, unit_cost)
-        VALUES %s
-        ON CONFLICT (name) DO UPDATE
-        SET qty = EXCLUDED.qty,
-            unit_cost = EXCLUDED.unit_cost
-        """,
-        rows,
-    )
-    pg_conn.commit()
-    cur.close()
-    print(f"[chemicals] Migrated {len(rows)} rows to Neon.")
-
-
-def migrate_chemical_movements(pg_conn):
-    df = load_sqlite_table("chemical_movements")
-    if df.empty:
-        print("[chemical_movements] No data to migrate.")
-        return
-
-    for col in ["d", "name", "movement_type", "qty", "remarks"]:
-        if col not in df.columns:
-            if col in ["qty"]:
-                df[col] = 0.0
-            else:
-                df[col] = ""
-
-    rows = list(
-        zip(
-            df["d"],
-            df["name"],
-            df["movement_type"],
-            df["qty"],
-            df["remarks"],
-        )
-    )
-
-    cur = pg_conn.cursor()
-    execute_values(
-        cur,
-        """
-        INSERT INTO chemical_movements
-            (d, name, movement_type, qty, remarks)
-        VALUES %s
-        """,
-        rows,
-    )
-    pg_conn.commit()
-    cur.close()
-    print(f"[chemical_movements] Migrated {len(rows)} rows to Neon.")
-
-
-def main():
-    print("[1] Connecting to Neon...")
-    pg_conn = psycopg2.connect(NEON_URL)
-
-    print("[2] Creating tables if not exist...")
-    create_tables_pg(pg_conn)
-
-    print("[3] Migrating readings...")
-    try:
-        migrate_readings(pg_conn)
-    except Exception as e:
-        print(f"[ERROR] readings: {e}")
-
-    print("[4] Migrating cartridge...")
-    try:
-        migrate_cartridge(pg_conn)
-    except Exception as e:
-        print(f"[ERROR] cartridge: {e}")
-
-    print("[5] Migrating chemicals...")
-    try:
-        migrate_chemicals(pg_conn)
-    except Exception as e:
-        print(f"[ERROR] chemicals: {e}")
-
-    print("[6] Migrating chemical_movements...")
-    try:
-        migrate_chemical_movements(pg_conn)
-    except Exception as e:
-        print(f"[ERROR] chemical_movements: {e}")
-
-    pg_conn.close()
-    print("✅ Migration finished.")
-
-
-if __name__ == "__main__":
-    main()
+"""Copy the legacy SQLite RO database (ro_uaq.db) into Neon Postgres.
+
+Tables are streamed in chunks of rowids: each chunk is read with a SQLite
+cursor, written through COPY FROM STDIN into a staging table and merged
+into the target together with the table's high-water mark in
+migration_checkpoint, all in one transaction. A rerun after a crash
+resumes after the last committed chunk instead of duplicating rows.
+Independent tables are migrated in parallel.
+
+Field sites keep writing to SQLite, so --sync copies only what changed
+since the last run: rows past the high-water mark, plus rows dated within
+the lookback window, which are re-read and updated where they differ.
+Running it often is cheap and idempotent. Running app processes only see
+rows written here once their read cache expires (RO_QUERY_CACHE_TTL,
+5 minutes by default), so dashboards may lag a sync by up to that long.
+
+--transform maps the legacy tables straight into the schema app.py reads
+(flowmeter_readings, water_quality, cartridge_filters, chemicals_movement,
+...) in one streaming pass and one transaction, then rebuilds
+daily_production.
+
+--verify checks copied tables against SQLite: id ranges are hashed on both
+sides in parallel and mismatched ranges bisected down to the rows at fault.
+
+    python migrate_ro_to_neon.py
+    python migrate_ro_to_neon.py --sqlite ro_uaq.db --workers 2 --restart
+    python migrate_ro_to_neon.py --sync --every 5
+    python migrate_ro_to_neon.py --transform --replace
+    python migrate_ro_to_neon.py --verify
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+# === 1) PATH TO YOUR LOCAL SQLITE DB ===
+SQLITE_DB = r"C:\Users\acer\OneDrive\Nileps\NFM_RO\ro_uaq.db"
+
+# === 2) YOUR NEON CONNECTION URL ===
+NEON_URL = (
+    "postgresql://neondb_owner:"
+    "npg_C4ghxK1yUcfw@"
+    "ep-billowing-fog-agxbr2fc-pooler.c-2.eu-central-1.aws.neon.tech/"
+    "neondb?sslmode=require&channel_binding=require"
+)
+
+CHUNK_ROWS = 20000   # rows per COPY / checkpoint
+WORKERS = 4          # tables migrated at the same time
+LOOKBACK_DAYS = 7    # --sync re-checks rows dated this many days before the newest
+
+# Null marker for COPY, so empty strings stay empty strings
+COPY_NULL = r"\N"
+
+# Legacy tables: columns with the value used when an old SQLite file lacks
+# the column, the conflict key in Postgres, whether a full copy updates on
+# conflict, and the date column --sync uses for its lookback window.
+# Tables with an id keep their SQLite ids, so a row is never copied twice.
+LEGACY_TABLES = {
+    "readings": {
+        "columns": {
+            "id": None, "d": None, "tds": None, "ph": None, "conductivity": None,
+            "flow_m3": None, "production": None, "maintenance": None, "notes": None,
+        },
+        "key": "id",
+        "update": False,
+        "date": "d",
+    },
+    "cartridge": {
+        "columns": {
+            "id": None, "d": None, "dp": 0, "remarks": "", "is_change": 0, "change_cost": 0,
+        },
+        "key": "id",
+        "update": False,
+        "date": "d",
+    },
+    "chemicals": {
+        "columns": {"name": "", "qty": 0.0, "unit_cost": 0.0},
+        "key": "name",
+        "update": True,
+        "date": None,
+    },
+    "chemical_movements": {
+        "columns": {
+            "id": None, "d": None, "name": "", "movement_type": "", "qty": 0.0, "remarks": "",
+        },
+        "key": "id",
+        "update": False,
+        "date": "d",
+    },
+}
+
+
+# -------------------------------------------------
+#  Create tables in Neon (same schema as new RO app)
+# -------------------------------------------------
+def create_tables_pg(conn):
+    cur = conn.cursor()
+
+    # readings
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS readings (
+            id SERIAL PRIMARY KEY,
+            d DATE,
+            tds DOUBLE PRECISION,
+            ph DOUBLE PRECISION,
+            conductivity DOUBLE PRECISION,
+            flow_m3 DOUBLE PRECISION,
+            production DOUBLE PRECISION,
+            maintenance TEXT,
+            notes TEXT
+        );
+    """)
+
+    # cartridge
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cartridge (
+            id SERIAL PRIMARY KEY,
+            d DATE,
+            dp DOUBLE PRECISION,
+            remarks TEXT,
+            is_change INTEGER DEFAULT 0,
+            change_cost DOUBLE PRECISION DEFAULT 0
+        );
+    """)
+
+    # chemicals
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chemicals (
+            name TEXT PRIMARY KEY,
+            qty DOUBLE PRECISION,
+            unit_cost DOUBLE PRECISION DEFAULT 0
+        );
+    """)
+
+    # chemical movements
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chemical_movements (
+            id SERIAL PRIMARY KEY,
+            d DATE,
+            name TEXT,
+            movement_type TEXT,
+            qty DOUBLE PRECISION,
+            remarks TEXT
+        );
+    """)
+
+    # Per-table high-water marks (SQLite rowid) of committed chunks
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS migration_checkpoint (
+            table_name TEXT PRIMARY KEY,
+            last_rowid BIGINT NOT NULL DEFAULT 0,
+            rows_copied BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+
+    conn.commit()
+    cur.close()
+
+
+# -------------------------------------------------
+#  Reading from SQLite
+# -------------------------------------------------
+def sqlite_select_list(sqlite_conn, table):
+    """SELECT expressions for a legacy table, filling columns old DBs lack."""
+    present = {row[1] for row in sqlite_conn.execute(f"PRAGMA table_info({table})")}
+    if not present:
+        return None
+    exprs = []
+    for col, default in LEGACY_TABLES[table]["columns"].items():
+        if col in present:
+            exprs.append(col)
+        elif col == "id":
+            # NULL would abort COPY into the SERIAL key; the rowid is what id would have held
+            exprs.append("rowid AS id")
+        elif default is None:
+            exprs.append(f"NULL AS {col}")
+        else:
+            exprs.append(f"{default!r} AS {col}")
+    return ", ".join(exprs)
+
+
+def iter_sqlite_chunks(sqlite_conn, table, after_rowid, chunk_rows, where=None, params=()):
+    """Yield (last rowid, rows) chunks of a table in rowid order after ``after_rowid``.
+
+    ``where`` narrows the rows further, e.g. to a date window.
+    """
+    select_list = sqlite_select_list(sqlite_conn, table)
+    sql = (
+        f"SELECT rowid, {select_list} FROM {table} "
+        f"WHERE rowid > ? {'AND ' + where if where else ''} ORDER BY rowid LIMIT ?"
+    )
+    cur = sqlite_conn.cursor()
+    while True:
+        rows = cur.execute(sql, (after_rowid, *params, chunk_rows)).fetchall()
+        if not rows:
+            return
+        after_rowid = rows[-1][0]
+        yield after_rowid, [row[1:] for row in rows]
+        if len(rows) < chunk_rows:
+            return
+
+
+def rows_to_copy_buffer(rows):
+    """Render rows as CSV for COPY, with None as the COPY_NULL marker."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerows(
+        [COPY_NULL if v is None else v for v in row] for row in rows
+    )
+    buf.seek(0)
+    return buf
+
+
+# -------------------------------------------------
+#  Writing to Postgres
+# -------------------------------------------------
+def get_checkpoint(pg_conn, table):
+    with pg_conn.cursor() as cur:
+        cur.execute(
+            "SELECT last_rowid, rows_copied FROM migration_checkpoint WHERE table_name = %s",
+            (table,),
+        )
+        row = cur.fetchone()
+    pg_conn.commit()
+    return row or (0, 0)
+
+
+def check_untracked_rows(pg_conn, table):
+    """Refuse to copy into a table holding rows this script has no checkpoint for.
+
+    Rows keep their SQLite ids, so rows loaded earlier with fresh serial ids
+    (e.g. by the old migrator) would be silently skipped on conflict, or
+    overwritten by --sync.
+    """
+    if LEGACY_TABLES[table]["key"] != "id":
+        return
+    with pg_conn.cursor() as cur:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        non_empty = cur.fetchone()[0]
+    pg_conn.commit()
+    if non_empty:
+        raise RuntimeError(
+            f"{table} already holds rows without a migration checkpoint. Empty it, or rerun "
+            f"with --restart if those rows were copied by this script (same ids as SQLite)."
+        )
+
+
+def reset_checkpoints(pg_conn, tables):
+    with pg_conn.cursor() as cur:
+        cur.execute("DELETE FROM migration_checkpoint WHERE table_name = ANY(%s)", (list(tables),))
+    pg_conn.commit()
+
+
+def merge_sql(table, update=None):
+    """INSERT from the staging table; ``update`` overrides the table's conflict action.
+
+    Updates only touch rows whose values actually differ, so re-syncing an
+    unchanged row costs no write.
+    """
+    spec = LEGACY_TABLES[table]
+    cols = list(spec["columns"])
+    col_list = ", ".join(cols)
+    if spec["update"] if update is None else update:
+        values = [c for c in cols if c != spec["key"]]
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in values)
+        changed = (
+            f"({', '.join(f'{table}.{c}' for c in values)}) IS DISTINCT FROM "
+            f"({', '.join(f'EXCLUDED.{c}' for c in values)})"
+        )
+        action = f"DO UPDATE SET {updates} WHERE {changed}"
+    else:
+        action = "DO NOTHING"
+    return (
+        f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM migration_stage "
+        f"ON CONFLICT ({spec['key']}) {action}"
+    )
+
+
+def copy_chunk(pg_conn, table, rows, last_rowid, update=None):
+    """COPY one chunk, merge it and advance the checkpoint in one transaction.
+
+    With ``last_rowid`` None the checkpoint is left alone. Returns the
+    number of rows inserted or updated.
+    """
+    col_list = ", ".join(LEGACY_TABLES[table]["columns"])
+    with pg_conn.cursor() as cur:
+        cur.execute(
+            f"CREATE TEMP TABLE migration_stage ON COMMIT DROP AS "
+            f"SELECT {col_list} FROM {table} WITH NO DATA"
+        )
+        cur.copy_expert(
+            f"COPY migration_stage ({col_list}) FROM STDIN "
+            f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            rows_to_copy_buffer(rows),
+        )
+        cur.execute(merge_sql(table, update))
+        merged = cur.rowcount
+        if last_rowid is None:
+            pg_conn.commit()
+            return merged
+        cur.execute(
+            """
+            INSERT INTO migration_checkpoint (table_name, last_rowid, rows_copied, updated_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (table_name) DO UPDATE
+            SET last_rowid = EXCLUDED.last_rowid,
+                rows_copied = migration_checkpoint.rows_copied + EXCLUDED.rows_copied,
+                updated_at = NOW()
+            """,
+            (table, last_rowid, len(rows)),
+        )
+    pg_conn.commit()
+    return merged
+
+
+def sync_sequence(pg_conn, table):
+    """Move the SERIAL sequence past the copied ids so app inserts don't collide."""
+    if LEGACY_TABLES[table]["key"] != "id":
+        return
+    with pg_conn.cursor() as cur:
+        cur.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+        )
+    pg_conn.commit()
+
+
+# -------------------------------------------------
+#  Migrate one table
+# -------------------------------------------------
+def migrate_table(table, sqlite_path, pg_url, chunk_rows, restart=False):
+    """Stream one table from its checkpoint on; return (rows copied, seconds)."""
+    started = time.perf_counter()
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    pg_conn = psycopg2.connect(pg_url)
+    try:
+        if sqlite_select_list(sqlite_conn, table) is None:
+            print(f"[{table}] Not in SQLite, skipped.")
+            return 0, 0.0
+        last_rowid, total = get_checkpoint(pg_conn, table)
+        if not last_rowid and not restart:
+            check_untracked_rows(pg_conn, table)
+        if last_rowid:
+            print(f"[{table}] Resuming after rowid {last_rowid} ({total} rows already copied).")
+
+        copied = 0
+        for last_rowid, rows in iter_sqlite_chunks(sqlite_conn, table, last_rowid, chunk_rows):
+            copy_chunk(pg_conn, table, rows, last_rowid)
+            copied += len(rows)
+            elapsed = time.perf_counter() - started
+            print(f"[{table}] {copied} rows ({copied / elapsed:,.0f} rows/s)")
+        sync_sequence(pg_conn, table)
+        return copied, time.perf_counter() - started
+    finally:
+        sqlite_conn.close()
+        pg_conn.close()
+
+
+# -------------------------------------------------
+#  Incremental sync of one table
+# -------------------------------------------------
+def lookback_window(sqlite_conn, table, last_rowid, lookback_days):
+    """WHERE clause and params for already-synced rows that may have been edited."""
+    date_col = LEGACY_TABLES[table]["date"]
+    if date_col is None:
+        # Small lookup table without dates: re-check every row
+        return f"rowid <= {int(last_rowid)}", ()
+    newest = sqlite_conn.execute(f"SELECT MAX({date_col}) FROM {table}").fetchone()[0]
+    if newest is None:
+        return None, ()
+    return (
+        f"rowid <= {int(last_rowid)} AND {date_col} >= date(?, ?)",
+        (newest, f"-{int(lookback_days)} days"),
+    )
+
+
+def sync_table(table, sqlite_path, pg_url, chunk_rows, lookback_days, restart=False):
+    """Copy new rows and update recently dated changed ones; return (new, changed, seconds)."""
+    started = time.perf_counter()
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    pg_conn = psycopg2.connect(pg_url)
+    try:
+        if sqlite_select_list(sqlite_conn, table) is None:
+            return 0, 0, 0.0
+        last_rowid, _ = get_checkpoint(pg_conn, table)
+        if not last_rowid and not restart:
+            check_untracked_rows(pg_conn, table)
+
+        changed = 0
+        if last_rowid:
+            where, params = lookback_window(sqlite_conn, table, last_rowid, lookback_days)
+            if where:
+                for _, rows in iter_sqlite_chunks(sqlite_conn, table, 0, chunk_rows, where, params):
+                    changed += copy_chunk(pg_conn, table, rows, None, update=True)
+
+        new = 0
+        for last_rowid, rows in iter_sqlite_chunks(sqlite_conn, table, last_rowid, chunk_rows):
+            copy_chunk(pg_conn, table, rows, last_rowid, update=True)
+            new += len(rows)
+        if new:
+            sync_sequence(pg_conn, table)
+        return new, changed, time.perf_counter() - started
+    finally:
+        sqlite_conn.close()
+        pg_conn.close()
+
+
+def run_sync(args):
+    """One incremental pass over the selected tables, in parallel."""
+    started = time.perf_counter()
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(sync_table, table, args.sqlite, args.pg_url,
+                        args.chunk_rows, args.lookback_days, args.restart): table
+            for table in args.tables
+        }
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                new, changed, seconds = future.result()
+            except Exception as e:
+                print(f"[ERROR] {table}: {e}")
+                failed.append(table)
+                continue
+            print(f"[{table}] {new} new, {changed} changed rows in {seconds:.1f}s.")
+    print(f"Sync pass finished in {time.perf_counter() - started:.1f}s.")
+    return failed
+
+
+# -------------------------------------------------
+#  Transform legacy rows into the app schema
+# -------------------------------------------------
+# The legacy app logged one product water sample per reading
+LEGACY_QUALITY_POINT = "Permeate"
+
+# App tables the transform fills; they must be empty unless --replace
+APP_TARGETS = [
+    "flowmeter_readings", "daily_production", "water_quality", "maintenance_log",
+    "cartridge_filters", "chemicals_movement", "chemicals_stock",
+]
+
+
+def iter_sqlite_frames(sqlite_conn, table, order_by, chunk_rows):
+    """Yield DataFrame chunks of a legacy table from one streaming SQLite cursor."""
+    select_list = sqlite_select_list(sqlite_conn, table)
+    if select_list is None:
+        return
+    cur = sqlite_conn.cursor()
+    cur.execute(f"SELECT {select_list} FROM {table} ORDER BY {order_by}")
+    cols = [d[0] for d in cur.description]
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        df = pd.DataFrame.from_records(rows, columns=cols)
+        df["d"] = pd.to_datetime(df["d"], errors="coerce").dt.date
+        yield df
+
+
+def copy_frame(cur, table, df):
+    """COPY a DataFrame into ``table``; columns are taken from the frame."""
+    if df.empty:
+        return 0
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, na_rep=COPY_NULL)
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(df.columns)}) FROM STDIN "
+        f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+        buf,
+    )
+    return len(df)
+
+
+def numeric_columns(chunk, columns):
+    """``chunk`` with ``columns`` as floats; a chunk where a column is all NULL reads as object."""
+    return chunk.assign(**{c: pd.to_numeric(chunk[c], errors="coerce") for c in columns})
+
+
+def transform_readings(chunk):
+    """Split legacy readings into (flowmeter, water_quality, maintenance_log) frames."""
+    chunk = numeric_columns(chunk, ["flow_m3", "tds", "ph", "conductivity"])
+    flow = chunk[chunk["d"].notna() & chunk["flow_m3"].notna()]
+    flow = pd.DataFrame({
+        "reading_date": flow["d"],
+        "reading_value": flow["flow_m3"].round(2),
+        "notes": flow["notes"],
+    })
+
+    quality = chunk[chunk["d"].notna() & chunk[["tds", "ph", "conductivity"]].notna().any(axis=1)]
+    quality = pd.DataFrame({
+        "sample_date": quality["d"],
+        "point": LEGACY_QUALITY_POINT,
+        "tds": quality["tds"].round(2),
+        # NUMERIC(4,2): a mistyped pH would abort the whole transaction
+        "ph": quality["ph"].where(quality["ph"].between(0, 14)).round(2),
+        "conductivity": quality["conductivity"].round(2),
+        "notes": quality["notes"],
+    })
+
+    maint = chunk[chunk["d"].notna() & chunk["maintenance"].fillna("").str.strip().ne("")]
+    maint = pd.DataFrame({
+        "maint_date": maint["d"],
+        "action": maint["maintenance"],
+        "notes": maint["notes"],
+    })
+    return flow, quality, maint
+
+
+def transform_cartridge(chunk):
+    chunk = numeric_columns(chunk[chunk["d"].notna()], ["dp", "is_change", "change_cost"])
+    dp = chunk["dp"]
+    change_note = np.where(
+        chunk["is_change"].fillna(0) == 1,
+        "Cartridge changed (cost " + chunk["change_cost"].fillna(0).map("{:.2f}".format) + ")",
+        None,
+    )
+    remarks = chunk["remarks"].replace("", None)
+    return pd.DataFrame({
+        "entry_date": chunk["d"],
+        "diff_pressure": dp.round(2),
+        "status": np.select([dp < 1, dp < 2], ["OK", "Warning"], "Alarm"),
+        "notes": remarks.combine_first(pd.Series(change_note, index=chunk.index)),
+    })
+
+
+def transform_movements(chunk, balances, unit_costs):
+    """Map movements to qty_in / qty_out with running balances per chemical.
+
+    ``balances`` holds each chemical's balance after the previous chunk and
+    is updated in place, so the cumulative sums continue across chunks.
+    """
+    chunk = numeric_columns(chunk[chunk["d"].notna()], ["qty"])
+    # Sum the quantities as stored, so balances match the NUMERIC(12,2) rows
+    qty = chunk["qty"].fillna(0).round(2)
+    incoming = chunk["movement_type"].fillna("").str.strip().str.upper().eq("IN")
+    signed = np.where(incoming, qty, -qty)
+    running = pd.Series(signed, index=chunk.index).groupby(chunk["name"]).cumsum()
+    balance = running + chunk["name"].map(balances).fillna(0.0)
+    balances.update(balance.groupby(chunk["name"]).last().to_dict())
+    unit_cost = chunk["name"].map(unit_costs)
+    return pd.DataFrame({
+        "movement_date": chunk["d"],
+        "chemical": chunk["name"],
+        "qty_in": qty.where(incoming),
+        "qty_out": qty.where(~incoming),
+        "balance": balance.round(2),
+        "unit_cost": unit_cost.round(2),
+        "stock_value": (balance * unit_cost).round(2),
+        "notes": chunk["remarks"].replace("", None),
+    })
+
+
+def transform_to_app_schema(sqlite_path, pg_url, chunk_rows, replace=False):
+    """Fill the app tables from the legacy SQLite tables in one transaction.
+
+    Returns {table: rows written}. Refuses to touch non-empty app tables
+    unless ``replace`` is set, in which case they are emptied first.
+    """
+    # Only the transform needs the app (and with it Streamlit and its sqlite3 adapters)
+    import app
+
+    app.DB_URL = pg_url
+    app.DB_BACKEND = "postgres"
+    app.init_db()
+
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    pg_conn = psycopg2.connect(pg_url)
+    written = dict.fromkeys(APP_TARGETS, 0)
+    try:
+        with pg_conn.cursor() as cur:
+            cur.execute(
+                " UNION ALL ".join(
+                    f"SELECT '{t}' WHERE EXISTS (SELECT 1 FROM {t})" for t in APP_TARGETS
+                )
+            )
+            non_empty = [row[0] for row in cur.fetchall()]
+            if non_empty and not replace:
+                raise RuntimeError(
+                    f"App tables already hold data: {', '.join(non_empty)}. "
+                    f"Rerun with --replace to overwrite them."
+                )
+            if non_empty:
+                cur.execute(f"TRUNCATE {', '.join(APP_TARGETS)}")
+
+            # Readings: one flowmeter value per day (the day's last reading)
+            daily = []
+            for chunk in iter_sqlite_frames(sqlite_conn, "readings", "d, rowid", chunk_rows):
+                flow, quality, maint = transform_readings(chunk)
+                daily.append(flow.drop_duplicates("reading_date", keep="last"))
+                written["water_quality"] += copy_frame(cur, "water_quality", quality)
+                written["maintenance_log"] += copy_frame(cur, "maintenance_log", maint)
+            if daily:
+                flow = pd.concat(daily).drop_duplicates("reading_date", keep="last")
+                written["flowmeter_readings"] = copy_frame(cur, "flowmeter_readings", flow)
+                if len(flow) >= 2:
+                    prod = app.compute_daily_production(flow)
+                    written["daily_production"] = copy_frame(cur, "daily_production", prod)
+
+            for chunk in iter_sqlite_frames(sqlite_conn, "cartridge", "d, rowid", chunk_rows):
+                written["cartridge_filters"] += copy_frame(
+                    cur, "cartridge_filters", transform_cartridge(chunk)
+                )
+
+            select_list = sqlite_select_list(sqlite_conn, "chemicals")
+            if select_list is None:
+                stock = pd.DataFrame(columns=["name", "qty", "unit_cost"])
+            else:
+                stock = pd.read_sql(f"SELECT {select_list} FROM chemicals", sqlite_conn)
+            unit_costs = dict(zip(stock["name"], stock["unit_cost"].fillna(0).astype(float)))
+
+            balances = {}
+            for chunk in iter_sqlite_frames(sqlite_conn, "chemical_movements", "d, rowid", chunk_rows):
+                written["chemicals_movement"] += copy_frame(
+                    cur, "chemicals_movement", transform_movements(chunk, balances, unit_costs)
+                )
+            written["chemicals_stock"] = copy_frame(cur, "chemicals_stock", pd.DataFrame({
+                "chemical": stock["name"],
+                "stock_qty": stock["qty"].astype(float).round(2),
+                "unit_cost": stock["unit_cost"].astype(float).round(2),
+                "stock_value": (stock["qty"] * stock["unit_cost"]).astype(float).round(2),
+            }))
+        pg_conn.commit()
+    finally:
+        sqlite_conn.close()
+        pg_conn.close()
+    app.get_query_cache().clear()
+    return written
+
+
+# -------------------------------------------------
+#  Verify copied tables with per-chunk checksums
+# -------------------------------------------------
+VERIFY_CHUNK_ROWS = 50000   # id range hashed per task
+VERIFY_LEAF_ROWS = 64       # mismatched ranges are bisected down to this size, then diffed
+
+# Column and row separators of the canonical row text
+FIELD_SEP, ROW_SEP = "\x1f", "\x1e"
+
+_verify_local = threading.local()
+_verify_opened = []  # every worker's connections, closed when verify_tables returns
+_verify_lock = threading.Lock()
+
+
+def _verify_conns(sqlite_path, pg_url):
+    """One SQLite and one Postgres connection per verify worker thread."""
+    if getattr(_verify_local, "conns", None) is None:
+        pg_conn = psycopg2.connect(pg_url)
+        pg_conn.autocommit = True
+        # Closed from the main thread once the workers are done
+        _verify_local.conns = (sqlite3.connect(sqlite_path, check_same_thread=False), pg_conn)
+        with _verify_lock:
+            _verify_opened.append(_verify_local.conns)
+    return _verify_local.conns
+
+
+def canonical_value(value, is_date=False):
+    """Text of a SQLite value as Postgres renders the migrated column."""
+    if value is None:
+        return COPY_NULL
+    if is_date:
+        return str(value)[:10]
+    if isinstance(value, float):
+        # Postgres prints float8 as the shortest round-trip text, without ".0"
+        text = repr(value)
+        return text[:-2] if text.endswith(".0") else text
+    return str(value)
+
+
+def pg_row_text(table):
+    cols = LEGACY_TABLES[table]["columns"]
+    return f"concat_ws(chr(31), {', '.join(f'COALESCE({c}::text, %(null)s)' for c in cols)})"
+
+
+def range_filter(table, lo, hi, column):
+    if LEGACY_TABLES[table]["key"] != "id":
+        return "", {}
+    return f"WHERE {column} BETWEEN %(lo)s AND %(hi)s", {"lo": lo, "hi": hi}
+
+
+def sqlite_rows(sqlite_conn, table, lo, hi):
+    """(key, canonical row text) of SQLite rows in [lo, hi], in key order."""
+    spec = LEGACY_TABLES[table]
+    where, params = range_filter(table, lo, hi, "rowid")
+    where = where.replace("%(lo)s", ":lo").replace("%(hi)s", ":hi")
+    cur = sqlite_conn.execute(
+        f"SELECT {sqlite_select_list(sqlite_conn, table)} FROM {table} {where} ORDER BY {spec['key']}",
+        params,
+    )
+    key_pos = list(spec["columns"]).index(spec["key"])
+    date_pos = [c == spec["date"] for c in spec["columns"]]
+    return [
+        (row[key_pos], FIELD_SEP.join(canonical_value(v, d) for v, d in zip(row, date_pos)))
+        for row in cur
+    ]
+
+
+def pg_order_key(table):
+    # Byte order, as SQLite sorts text keys
+    key = LEGACY_TABLES[table]["key"]
+    return key if key == "id" else f'{key} COLLATE "C"'
+
+
+def pg_rows(pg_conn, table, lo, hi):
+    """(key, row text) of Postgres rows in [lo, hi], in key order."""
+    key = LEGACY_TABLES[table]["key"]
+    where, params = range_filter(table, lo, hi, "id")
+    with pg_conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {key}, {pg_row_text(table)} FROM {table} {where} ORDER BY {pg_order_key(table)}",
+            {**params, "null": COPY_NULL},
+        )
+        return cur.fetchall()
+
+
+def range_checksums(sqlite_conn, pg_conn, table, lo, hi):
+    """((count, md5) on SQLite, (count, md5) on Postgres) for one key range."""
+    texts = [text for _, text in sqlite_rows(sqlite_conn, table, lo, hi)]
+    local = (len(texts), hashlib.md5(ROW_SEP.join(texts).encode()).hexdigest())
+
+    key = LEGACY_TABLES[table]["key"]
+    where, params = range_filter(table, lo, hi, "id")
+    with pg_conn.cursor() as cur:
+        cur.execute(
+            f"SELECT COUNT(*), md5(COALESCE(string_agg(row_text, chr(30) "
+            f"ORDER BY {pg_order_key(table)}), '')) "
+            f"FROM (SELECT {key}, {pg_row_text(table)} AS row_text FROM {table} {where}) t",
+            {**params, "null": COPY_NULL},
+        )
+        remote = cur.fetchone()
+    return local, tuple(remote)
+
+
+def diff_rows(sqlite_conn, pg_conn, table, lo, hi):
+    """Keys in [lo, hi] that are missing, extra or different in Postgres."""
+    local = dict(sqlite_rows(sqlite_conn, table, lo, hi))
+    remote = dict(pg_rows(pg_conn, table, lo, hi))
+    problems = [(k, "missing in Postgres") for k in local.keys() - remote.keys()]
+    problems += [(k, "not in SQLite") for k in remote.keys() - local.keys()]
+    problems += [(k, "values differ") for k in local.keys() & remote.keys() if local[k] != remote[k]]
+    return sorted(problems)
+
+
+def verify_range(table, lo, hi, sqlite_path, pg_url):
+    """Checksum one range; bisect it down to the offending rows on a mismatch."""
+    sqlite_conn, pg_conn = _verify_conns(sqlite_path, pg_url)
+    local, remote = range_checksums(sqlite_conn, pg_conn, table, lo, hi)
+    if local == remote:
+        return []
+    if lo is None or hi - lo < VERIFY_LEAF_ROWS:
+        return diff_rows(sqlite_conn, pg_conn, table, lo, hi)
+    mid = (lo + hi) // 2
+    return (verify_range(table, lo, mid, sqlite_path, pg_url)
+            + verify_range(table, mid + 1, hi, sqlite_path, pg_url))
+
+
+def verify_ranges(table, sqlite_path, pg_url, chunk_rows):
+    """Key ranges covering a table on both sides; one whole-table range without ids."""
+    if LEGACY_TABLES[table]["key"] != "id":
+        return [(None, None)]
+    sqlite_conn, pg_conn = _verify_conns(sqlite_path, pg_url)
+    lo, hi = sqlite_conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    with pg_conn.cursor() as cur:
+        cur.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+        pg_lo, pg_hi = cur.fetchone()
+    lows = [v for v in (lo, pg_lo) if v is not None]
+    highs = [v for v in (hi, pg_hi) if v is not None]
+    if not lows:
+        return []
+    lo, hi = min(lows), max(highs)
+    return [(start, min(start + chunk_rows - 1, hi)) for start in range(lo, hi + 1, chunk_rows)]
+
+
+def verify_tables(tables, sqlite_path, pg_url, workers, chunk_rows=VERIFY_CHUNK_ROWS):
+    """Checksum every table chunk in parallel; return {table: [(key, problem), ...]}."""
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    present = [t for t in tables if sqlite_select_list(sqlite_conn, t)]
+    sqlite_conn.close()
+
+    problems = {table: [] for table in present}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            range_lists = pool.map(lambda t: verify_ranges(t, sqlite_path, pg_url, chunk_rows), present)
+            futures = {
+                pool.submit(verify_range, table, lo, hi, sqlite_path, pg_url): table
+                for table, ranges in zip(present, range_lists)
+                for lo, hi in ranges
+            }
+            for future in as_completed(futures):
+                problems[futures[future]].extend(future.result())
+    finally:
+        with _verify_lock:
+            for conns in _verify_opened:
+                for conn in conns:
+                    conn.close()
+            _verify_opened.clear()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the legacy SQLite RO database to Postgres.")
+    parser.add_argument("--sqlite", default=SQLITE_DB, help="SQLite database file")
+    parser.add_argument("--pg-url", default=NEON_URL, help="target Postgres URL")
+    parser.add_argument("--tables", nargs="+", choices=list(LEGACY_TABLES), default=list(LEGACY_TABLES))
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--restart", action="store_true",
+                        help="forget checkpoints and copy every table from the start; also "
+                             "accepts tables already holding rows this script copied")
+    parser.add_argument("--sync", action="store_true",
+                        help="copy only new rows and rows changed within the lookback window; "
+                             "running apps show them once their query cache expires "
+                             "(RO_QUERY_CACHE_TTL, default 5 min)")
+    parser.add_argument("--lookback-days", type=int, default=LOOKBACK_DAYS)
+    parser.add_argument("--every", type=float, metavar="MINUTES",
+                        help="with --sync: repeat the sync pass every MINUTES until interrupted")
+    parser.add_argument("--transform", action="store_true",
+                        help="load the legacy rows into the app tables instead of copying them as-is")
+    parser.add_argument("--replace", action="store_true",
+                        help="with --transform: empty app tables that already hold data")
+    parser.add_argument("--verify", action="store_true",
+                        help="compare copied tables with SQLite by per-chunk checksums")
+    args = parser.parse_args()
+
+    if args.verify:
+        print(f"[1] Verifying {', '.join(args.tables)} with {args.workers} workers...")
+        started = time.perf_counter()
+        problems = verify_tables(args.tables, args.sqlite, args.pg_url, args.workers)
+        bad = 0
+        for table, rows in problems.items():
+            print(f"[{table}] {'OK' if not rows else f'{len(rows)} rows differ'}")
+            for key, problem in rows[:20]:
+                print(f"    {key}: {problem}")
+            if len(rows) > 20:
+                print(f"    ... and {len(rows) - 20} more")
+            bad += len(rows)
+        print(f"Verified in {time.perf_counter() - started:.1f}s.")
+        if bad:
+            print(f"❌ {bad} rows differ. Delete them in Postgres and rerun with --restart to copy them again.")
+            raise SystemExit(1)
+        print("✅ Postgres matches SQLite.")
+        return
+
+    if args.transform:
+        print("[1] Transforming legacy tables into the app schema...")
+        started = time.perf_counter()
+        try:
+            written = transform_to_app_schema(args.sqlite, args.pg_url, args.chunk_rows, args.replace)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        elapsed = time.perf_counter() - started
+        for table, rows in written.items():
+            print(f"[{table}] {rows} rows")
+        total = sum(written.values())
+        print(f"✅ Wrote {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s).")
+        return
+
+    print("[1] Connecting to Postgres...")
+    pg_conn = psycopg2.connect(args.pg_url)
+
+    print("[2] Creating tables if not exist...")
+    create_tables_pg(pg_conn)
+    if args.restart:
+        reset_checkpoints(pg_conn, args.tables)
+    pg_conn.close()
+
+    if args.sync or args.every:
+        print(f"[3] Syncing {', '.join(args.tables)} (lookback {args.lookback_days} days)...")
+        try:
+            while True:
+                failed = run_sync(args)
+                if not args.every:
+                    break
+                time.sleep(args.every * 60)
+        except KeyboardInterrupt:
+            print("Sync stopped.")
+            return
+        if failed:
+            raise SystemExit(1)
+        return
+
+    print(f"[3] Migrating {', '.join(args.tables)} with {args.workers} workers...")
+    started = time.perf_counter()
+    grand_total = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(migrate_table, table, args.sqlite, args.pg_url, args.chunk_rows,
+                        args.restart): table
+            for table in args.tables
+        }
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                copied, seconds = future.result()
+            except Exception as e:
+                print(f"[ERROR] {table}: {e}")
+                failed.append(table)
+                continue
+            grand_total += copied
+            rate = copied / seconds if seconds else 0
+            print(f"[{table}] Done: {copied} rows in {seconds:.1f}s ({rate:,.0f} rows/s).")
+
+    elapsed = time.perf_counter() - started
+    print(f"Copied {grand_total} rows in {elapsed:.1f}s ({grand_total / max(elapsed, 1e-9):,.0f} rows/s).")
+    if failed:
+        print(f"❌ Failed: {', '.join(failed)}. Rerun to resume from the last checkpoint.")
+        raise SystemExit(1)
+    print("✅ Migration finished.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A fresh, migrated SQLite database behind the app's data helpers."""
+    monkeypatch.setattr(app, "DB_BACKEND", "sqlite")
+    monkeypatch.setattr(app, "SQLITE_PATH", str(tmp_path / "ro.db"))
+    app.get_pool.clear()
+    app.get_query_cache().clear()
+    app.init_db()
+    yield
+    app.get_pool.clear()
+    app.get_query_cache().clear()
+
+
+def import_frame(target, frame):
+    rows, rejected = app.validate_import(target, frame)
+    assert rejected.empty, rejected["reason"].tolist()
+    inserted, updated, _ = app.import_rows(target, rows)
+    return inserted, updated
+
+
+def water_quality():
+    return app.fetch_df(
+        "SELECT sample_date, sample_time, point, tds, operator FROM water_quality "
+        "ORDER BY sample_date, id",
+        cache=False,
+    )
+
+
+def test_validate_import_pads_times_and_rejects_in_file_duplicates():
+    raw = pd.DataFrame({
+        "sample_date": ["2024-01-01", "2024-01-01", "2024-01-02"],
+        "sample_time": ["8:00", "08:00", "bad"],
+        "point": ["feed", "Feed", "Feed"],
+    })
+
+    rows, rejected = app.validate_import("Water quality samples", raw)
+
+    assert rows["sample_time"].tolist() == ["08:00:00"]
+    assert rows["point"].tolist() == ["Feed"]
+    assert rejected["row"].tolist() == [2, 4]
+    assert rejected["reason"].tolist() == [
+        "duplicate of a later row in the file", "sample_time: not a time (HH:MM)",
+    ]
+
+
+def test_validate_import_missing_required_column():
+    with pytest.raises(ValueError, match="reading_value"):
+        app.validate_import("Flowmeter readings", pd.DataFrame({"reading_date": ["2024-01-01"]}))
+
+
+def test_validate_import_keeps_absent_key_columns():
+    raw = pd.DataFrame({"sample_date": ["2024-01-01"], "point": ["Feed"], "tds": ["100"]})
+
+    rows, _ = app.validate_import("Water quality samples", raw)
+
+    assert list(rows.columns) == ["sample_date", "sample_time", "point", "tds"]
+    assert rows["sample_time"].isna().all()
+
+
+def test_import_rows_upserts_on_key(sqlite_db):
+    first = pd.DataFrame({
+        "sample_date": ["2024-01-01", "2024-01-02"],
+        "sample_time": ["08:00", "08:00"],
+        "point": ["Feed", "Feed"],
+        "tds": ["100", "110"],
+        "operator": ["Ali", "Ali"],
+    })
+    assert import_frame("Water quality samples", first) == (2, 0)
+
+    # No operator column: the matched row keeps its operator
+    second = pd.DataFrame({
+        "sample_date": ["2024-01-01", "2024-01-03"],
+        "sample_time": ["8:00", "09:00"],
+        "point": ["Feed", "Feed"],
+        "tds": ["105", "120"],
+    })
+    assert import_frame("Water quality samples", second) == (1, 1)
+
+    df = water_quality()
+    assert df["tds"].tolist() == [105, 110, 120]
+    assert df["operator"].tolist()[:2] == ["Ali", "Ali"]
+    assert df["sample_time"].astype(str).tolist() == ["08:00:00"] * 2 + ["09:00:00"]
+
+
+def test_import_rows_without_optional_key_column(sqlite_db):
+    raw = pd.DataFrame({"sample_date": ["2024-01-01"], "point": ["Feed"], "tds": ["100"]})
+    assert import_frame("Water quality samples", raw) == (1, 0)
+
+    # NULL sample_time matches NULL
+    raw["tds"] = ["101"]
+    assert import_frame("Water quality samples", raw) == (0, 1)
+    assert water_quality()["tds"].tolist() == [101]
+
+
+def test_import_rows_with_key_columns_only(sqlite_db):
+    raw = pd.DataFrame({"sample_date": ["2024-01-01"], "sample_time": ["08:00"], "point": ["Feed"]})
+
+    assert import_frame("Water quality samples", raw) == (1, 0)
+    assert import_frame("Water quality samples", raw) == (0, 0)
+    assert len(water_quality()) == 1
+
+
+def test_insert_only_targets_keep_identical_rows(sqlite_db):
+    raw = pd.DataFrame({
+        "entry_date": ["2024-01-01", "2024-01-01"],
+        "pressure_before": ["1.0", "1.0"],
+        "pressure_after": ["2.5", "2.5"],
+    })
+
+    rows, rejected = app.validate_import("Cartridge filter readings", raw)
+    assert rejected.empty
+    assert app.similar_rows("Cartridge filter readings", rows) == (1, 0)
+    assert app.import_rows("Cartridge filter readings", rows)[:2] == (2, 0)
+    assert app.similar_rows("Cartridge filter readings", rows) == (1, 2)
+
+    stored = app.fetch_df("SELECT diff_pressure, status FROM cartridge_filters", cache=False)
+    assert stored["diff_pressure"].tolist() == [1.5, 1.5]
+    assert stored["status"].tolist() == ["Warning", "Warning"]
+
+
+def test_chemical_import_rebalances_stock(sqlite_db):
+    raw = pd.DataFrame({
+        "movement_date": ["2024-01-01", "2024-01-02", "2024-01-02"],
+        "chemical": ["hcl", "HCL", "HCL"],
+        "qty_in": ["100", None, None],
+        "qty_out": [None, "5", "5"],
+    })
+
+    assert import_frame("Chemical movements", raw) == (3, 0)
+
+    moves = app.fetch_df(
+        "SELECT balance FROM chemicals_movement WHERE chemical='HCL' ORDER BY movement_date, id",
+        cache=False,
+    )
+    assert moves["balance"].tolist() == [100, 95, 90]
+    stock = app.fetch_df("SELECT stock_qty FROM chemicals_stock WHERE chemical='HCL'", cache=False)
+    assert stock["stock_qty"].tolist() == [90]
@@ -0,0 +1,55 @@
+import datetime
+
+import pandas as pd
+
+import migrate_ro_to_neon as migrate
+
+
+def legacy_readings(**columns):
+    base = {
+        "id": [1, 2],
+        "d": [datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)],
+        "tds": [120.456, 130.0],
+        "ph": [7.123, 7.2],
+        "conductivity": [None, None],
+        "flow_m3": [1000.004, 1010.0],
+        "production": [None, None],
+        "maintenance": [None, "Flushed membranes"],
+        "notes": [None, None],
+    }
+    base.update(columns)
+    # Built from records like iter_sqlite_frames, so all-NULL columns are object dtype
+    return pd.DataFrame.from_records(list(zip(*base.values())), columns=list(base))
+
+
+def test_transform_readings_with_all_null_column():
+    flow, quality, maint = migrate.transform_readings(legacy_readings())
+
+    assert flow["reading_value"].tolist() == [1000.0, 1010.0]
+    assert quality["tds"].tolist() == [120.46, 130.0]
+    assert quality["ph"].tolist() == [7.12, 7.2]
+    assert quality["conductivity"].isna().all()
+    assert maint["action"].tolist() == ["Flushed membranes"]
+
+
+def test_transform_readings_with_all_null_measurements():
+    flow, quality, _ = migrate.transform_readings(
+        legacy_readings(tds=[None, None], ph=[None, None], flow_m3=[None, None])
+    )
+
+    assert flow.empty
+    assert quality.empty
+
+
+def test_transform_cartridge_with_all_null_column():
+    chunk = pd.DataFrame.from_records(
+        [(1, datetime.date(2020, 1, 1), None, "", 0, None),
+         (2, datetime.date(2020, 1, 2), None, "", 1, None)],
+        columns=["id", "d", "dp", "remarks", "is_change", "change_cost"],
+    )
+
+    out = migrate.transform_cartridge(chunk)
+
+    assert out["diff_pressure"].isna().all()
+    assert out["notes"].isna().tolist() == [True, False]
+    assert out["notes"].iloc[1] == "Cartridge changed (cost 0.00)"